@@ -0,0 +1,686 @@
+"""
+Benchmarks for the DNA sequencing pipeline in project.py.
+
+Run from the command line, e.g.:
+    python benchmark.py read_csv
+    python benchmark.py read_csv --sizes 100000 1000000 10000000
+    python benchmark.py stream_memory --sizes 1000000 3000000
+    python benchmark.py clean_positions --sizes 1000 100000 --legacy-max 1000
+    python benchmark.py import_time
+    python benchmark.py pipeline --sizes 10000 100000 1000000
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+import project
+
+
+# reference implementations, used as baseline for the timings
+
+
+def legacy_read_csv(name: str) -> pd.DataFrame:
+    '''Original line by line csv reader that interprets every value with eval.'''
+    with open(name, mode='r') as dna_file:
+        df_as_list = dna_file.readlines()
+        for index_r, reading in enumerate(df_as_list):
+            df_as_list[index_r] = reading.strip().split(',')
+            for index_v, value in enumerate(df_as_list[index_r]):
+                df_as_list[index_r][index_v] = eval(value)
+        return pd.DataFrame(df_as_list, columns=[
+            'SegmentNr', 'Position', 'A', 'C', 'G', 'T'])
+
+
+def legacy_clean_data(df: pd.DataFrame) -> pd.DataFrame:
+    '''Original clean_data, walking every segment with iterrows.'''
+    df, to_remove_segment = legacy_clean_positions(df)
+    to_remove_segment = legacy_clean_segments(df, to_remove_segment)
+    df = df.query('SegmentNr not in @to_remove_segment')
+    return df.reset_index(drop=True)
+
+
+def legacy_clean_positions(df: pd.DataFrame):
+    '''Original _clean_positions, one boolean mask per segment and iterrows per row.'''
+    segments = df['SegmentNr'].unique()
+    to_remove_index = []
+    to_remove_segment = []
+    index = 0
+    for segment in segments:
+        segment_index = 0
+        position_count = 1
+        segment_df = df[df['SegmentNr'] == segment]
+        for _, row in segment_df.iterrows():
+            if (row['Position'] > position_count) and row['SegmentNr'] not in to_remove_segment:
+                to_remove_segment += [row['SegmentNr']]
+            elif row['Position'] < position_count:
+                if list(segment_df.iloc[segment_index - 1]) == list(row):
+                    to_remove_index += [index]
+                elif row['SegmentNr'] not in to_remove_segment:
+                    to_remove_segment += [row['SegmentNr']]
+            else:
+                values = list(row[['A', 'C', 'G', 'T']])
+                if (not any(values) or values.count(1) > 1) and row['SegmentNr'] not in to_remove_segment:
+                    to_remove_segment += [row['SegmentNr']]
+                position_count += 1
+            index += 1
+            segment_index += 1
+    df = df.drop(to_remove_index)
+    return df, to_remove_segment
+
+
+def legacy_clean_segments(df: pd.DataFrame, to_remove_segment: list) -> list:
+    '''Original _clean_segments, comparing the contents of every pair of segments.'''
+    segments = df['SegmentNr'].unique()
+    segment_list = []
+    for segment in segments:
+        segment_list += [df.query('SegmentNr == @segment')
+                         [['A', 'C', 'G', 'T']].values.tolist()]
+    for index, list_values in enumerate(segment_list):
+        if segment_list.count(list_values) > 1:
+            to_remove_segment += [segments[index]]
+            segment_list[index] = ''
+    return to_remove_segment
+
+
+def legacy_is_valid_graph(graph) -> bool:
+    '''Original is_valid_graph, a recursive depth first search from every node.'''
+    connectivity_check = True
+    first_node = False
+    last_node = False
+    differ_degree = 0
+    for node in list(graph.nodes()):
+        if sorted(_legacy_dfs_recursive(graph, node, [])) != sorted(list(graph.nodes())):
+            connectivity_check = False
+        if graph.in_degree(node) != graph.out_degree(node):
+            differ_degree += 1
+            if graph.in_degree(node) - graph.out_degree(node) == 1:
+                last_node = True
+            elif graph.out_degree(node) - graph.in_degree(node) == 1:
+                first_node = True
+    degree_check = (last_node and first_node and differ_degree ==
+                    2) or differ_degree == 0
+    return connectivity_check and degree_check
+
+
+def _legacy_dfs_recursive(graph, starting_node: str, visited_list: list) -> list:
+    '''Original recursive depth first search used by legacy_is_valid_graph.'''
+    visited_list.append(starting_node)
+    for neigbour_node in set(list(graph.neighbors(starting_node)) + list(graph.predecessors(starting_node))):
+        if neigbour_node not in visited_list:
+            _legacy_dfs_recursive(graph, neigbour_node, visited_list)
+    return visited_list
+
+
+def legacy_construct_dna_sequence(graph) -> str:
+    '''Original construct_dna_sequence, recursive Hierholzer on a dense matrix.'''
+    _legacy_make_eulerian_graph(graph)
+    nodes = list(graph.nodes())
+    matrix = np.zeros((len(nodes), len(nodes)), dtype=int)
+    for start_node, end_node in graph.edges():
+        matrix[nodes.index(start_node)][nodes.index(end_node)] += 1
+    sequence_list = [nodes[index] for index in _legacy_hierholzer_algorithm(matrix, 0, [])]
+    return sequence_list[0] + ''.join(node[-1] for node in sequence_list[1:])
+
+
+def _legacy_make_eulerian_graph(graph) -> None:
+    '''Original _make_eulerian_graph used by legacy_construct_dna_sequence.'''
+    begin = ''
+    end = ''
+    for node in graph.nodes():
+        if graph.in_degree(node) - graph.out_degree(node) == 1:
+            end = node
+        elif graph.in_degree(node) - graph.out_degree(node) == -1:
+            begin = node
+    if begin and end:
+        graph.add_edge(end, begin)
+
+
+def _legacy_hierholzer_algorithm(matrix, starting_row_index: int, full_sequence: list) -> list:
+    '''Original recursive Hierholzer used by legacy_construct_dna_sequence.'''
+    for ending_node_index in np.where(matrix[starting_row_index] > 0)[0]:
+        matrix[starting_row_index][ending_node_index] -= 1
+        _legacy_hierholzer_algorithm(matrix, ending_node_index, full_sequence)
+        full_sequence.insert(0, starting_row_index)
+        if (matrix == np.zeros(matrix.shape, dtype=int)).all():
+            return full_sequence
+
+
+# generate input files
+
+
+def write_random_csv(name: str, n_rows: int, segment_length: int = 100, seed: int = 0) -> None:
+    '''
+    Write a csv file in the input layout of the project with random (error free) segments.
+
+    Input: name of the file, number of rows, number of positions per segment and random seed.
+    '''
+    rng = np.random.default_rng(seed)
+    rows = np.arange(n_rows)
+    one_hot = np.zeros((n_rows, 4), dtype=np.int8)
+    one_hot[rows, rng.integers(0, 4, n_rows)] = 1
+    df = pd.DataFrame({'SegmentNr': rows // segment_length + 1,
+                       'Position': rows % segment_length + 1})
+    df[['A', 'C', 'G', 'T']] = one_hot
+    df.to_csv(name, header=False, index=False)
+
+
+def random_dna_frame(n_segments: int, segment_length: int = 10, error_rate: float = 0.02,
+                     seed: int = 0) -> pd.DataFrame:
+    '''
+    Generate a DataFrame in the input layout with random segments and injected errors.
+
+    Input: number of segments, maximum number of positions per segment, probability
+    of each kind of error per row and random seed.
+
+    Returns DataFrame with missing, duplicate (equal and different) and shifted positions,
+    all zero and multiple one rows and duplicate segments, in shuffled segment order.
+    '''
+    rng = np.random.default_rng(seed)
+    segments = [rng.integers(0, 4, rng.integers(1, segment_length + 1))
+                for _ in range(n_segments)]
+    # duplicate segments: copy the bases of another segment
+    for index in np.flatnonzero(rng.random(n_segments) < 10 * error_rate):
+        segments[index] = segments[rng.integers(0, n_segments)]
+
+    rows = []
+    for segment_nr, bases in zip(rng.permutation(n_segments) + 1, segments):
+        for position, base in enumerate(bases, start=1):
+            values = [int(base == letter) for letter in range(4)]
+            error = rng.random(6) < error_rate
+            if error[0]:  # missing position
+                continue
+            if error[1]:  # all zeros
+                values = [0, 0, 0, 0]
+            if error[2]:  # multiple ones
+                values[rng.integers(0, 4)] = 1
+                values[rng.integers(0, 4)] = 1
+            if error[3]:  # shifted position
+                position += int(rng.integers(-2, 3))
+            rows += [[segment_nr, position] + values]
+            if error[4]:  # duplicate position, equal values
+                rows += [rows[-1]]
+            if error[5]:  # duplicate position, different values
+                rows += [[segment_nr, position] + list(rng.permutation(values))]
+    return pd.DataFrame(rows, columns=['SegmentNr', 'Position', 'A', 'C', 'G', 'T'])
+
+
+# the error classes clean_data handles, as injected by sequencing_frame
+ERROR_CLASSES = ['missing_position', 'duplicate_position_equal', 'duplicate_position_different',
+                 'all_zeros', 'multiple_ones', 'duplicate_segment']
+
+
+def sequencing_frame(genome_length: int, k: int = 25, segment_length: int = 100,
+                     error_rate: float = 0.01, seed: int = 0):
+    '''
+    Generate sequencing data of a random genome in the input layout of the project.
+
+    Input: number of nucleotides of the genome, the k it is meant to be assembled with,
+    number of positions per segment, probability of every error class per segment and
+    random seed.
+
+    Returns the DataFrame and the genome as DNA string. The genome is cut in segments
+    that overlap by k - 1 positions, so their k-mers spell the genome exactly once.
+    Every error class of ERROR_CLASSES is injected: equal duplicate positions in the
+    segments themselves (clean_data drops the extra row), exact copies of segments
+    (all but one are removed) and extra copies of segments with a missing position, a
+    different duplicate position, an all zero or a multiple one row (these copies are
+    removed). The segments are numbered in genome order, so the assembly starts at
+    the beginning of the genome, and the copies get the numbers after them. The copies
+    come first in the file and the rows of a segment stay together, but the segments
+    are shuffled.
+    '''
+    rng = np.random.default_rng(seed)
+    genome = rng.integers(0, 4, genome_length).astype(np.int8)
+    step = segment_length - (k - 1)
+    segments = [genome[start:start + segment_length]
+                for start in range(0, max(genome_length - k + 1, 1), step)]
+    # every segment: its one hot rows and positions
+    tables = []
+    for bases in segments:
+        one_hot = np.eye(4, dtype=np.int8)[bases]
+        positions = np.arange(1, len(bases) + 1)
+        if rng.random() < error_rate:  # duplicate position, equal values
+            row = rng.integers(0, len(bases))
+            one_hot = np.insert(one_hot, row, one_hot[row], axis=0)
+            positions = np.insert(positions, row, positions[row])
+        tables += [(positions, one_hot)]
+    for bases in segments:
+        one_hot = np.eye(4, dtype=np.int8)[bases]
+        positions = np.arange(1, len(bases) + 1)
+        error = rng.random(5) < error_rate
+        # a missing last position can not be noticed, so leave out an earlier one
+        if error[0] and len(bases) > 1:  # missing position
+            row = rng.integers(0, len(bases) - 1)
+            tables += [(np.delete(positions, row), np.delete(one_hot, row, axis=0))]
+        if error[1]:  # duplicate position, different values
+            row = rng.integers(0, len(bases))
+            tables += [(np.insert(positions, row + 1, positions[row]),
+                        np.insert(one_hot, row + 1, np.roll(one_hot[row], 1), axis=0))]
+        if error[2]:  # all zeros
+            changed = one_hot.copy()
+            changed[rng.integers(0, len(bases))] = 0
+            tables += [(positions, changed)]
+        if error[3]:  # multiple ones
+            changed = one_hot.copy()
+            row = rng.integers(0, len(bases))
+            changed[row] |= np.roll(changed[row], 1)
+            tables += [(positions, changed)]
+        if error[4]:  # duplicate segment
+            tables += [(positions, one_hot)]
+
+    # clean_data keeps the last copy of a duplicate segment: the one in genome order
+    order = np.concatenate((len(segments) + rng.permutation(len(tables) - len(segments)),
+                            rng.permutation(len(segments))))
+    df = pd.DataFrame({
+        'SegmentNr': np.repeat(order + 1, [len(tables[i][0]) for i in order]),
+        'Position': np.concatenate([tables[i][0] for i in order])})
+    df[['A', 'C', 'G', 'T']] = np.concatenate([tables[i][1] for i in order])
+    return df, ''.join(np.array(list('ACGT'))[genome])
+
+
+def random_genome_segments(n_k_mers: int, k: int = 21, seed: int = 0) -> dict:
+    '''
+    Cut a random genome in segments of 1000 nucleotides overlapping by k - 1.
+
+    Input: number of k-mers in the genome, length of the k-mers and random seed.
+
+    Returns dictionary with the PackedSequence of every segment number.
+    '''
+    genome = np.random.default_rng(seed).integers(0, 4, n_k_mers + k - 1)
+    step = 1000 - (k - 1)
+    return {segment_nr: project.PackedSequence(genome[start:start + 1000])
+            for segment_nr, start in enumerate(range(0, max(len(genome) - k + 1, 1), step))}
+
+
+def random_genome_graph(n_k_mers: int, k: int = 21, native: bool = False, seed: int = 0):
+    '''
+    Build the de Bruijn graph of a random genome, cut in segments overlapping by k - 1.
+
+    Input: number of k-mers in the genome, length of the k-mers, whether to build a
+    DeBruijnGraph instead of a networkx graph and random seed.
+
+    Returns the de Bruijn graph (a single path of n_k_mers edges).
+    '''
+    return project.construct_graph(random_genome_segments(n_k_mers, k, seed), k, native=native)
+
+
+def peak_memory(code: str) -> int:
+    '''
+    Run code in a fresh interpreter that has imported pandas and project.
+
+    Input: Python statements (that may use project).
+
+    Returns the peak resident memory in bytes while the code ran, on top of what was
+    resident before it (Linux only: the peak is reset after the imports, which take
+    more memory for a moment than they keep).
+    '''
+    script = '\n'.join([
+        'import pandas, project',
+        'def resident(field):',
+        '    with open("/proc/self/status") as status:',
+        '        return next(int(line.split()[1]) for line in status if line.startswith(field))',
+        'open("/proc/self/clear_refs", "w").write("5")',
+        'start = resident("VmRSS:")',
+        code,
+        'print(resident("VmHWM:") - start)'])
+    process = subprocess.run([sys.executable, '-c', script], capture_output=True, text=True,
+                             check=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+    return int(process.stdout) * 1024
+
+
+def _time(function, *args) -> float:
+    '''Return the wall time in seconds of a single call of function with args.'''
+    start = time.perf_counter()
+    function(*args)
+    return time.perf_counter() - start
+
+
+# benchmarks
+
+
+def benchmark_read_csv(sizes: list, legacy_max_rows: int) -> list:
+    '''
+    Compare the throughput of project.read_csv and of the memory mapped block reader
+    of the streaming mode with the original eval based reader.
+
+    Input: list of row counts to generate files for and the largest row count
+    for which the (slow) original reader is still timed.
+
+    Returns list of dictionaries with rows/sec for every file size.
+    '''
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for n_rows in sizes:
+            name = os.path.join(directory, f'bench_{n_rows}.csv')
+            write_random_csv(name, n_rows)
+            result = {'rows': n_rows,
+                      'read_csv': round(n_rows / _time(project.read_csv, name)),
+                      'mmap_blocks': round(n_rows / _time(
+                          lambda: list(project.iter_segment_blocks(name))))}
+            if n_rows <= legacy_max_rows:
+                result['legacy'] = round(n_rows / _time(legacy_read_csv, name))
+            results += [result]
+            os.remove(name)
+    return results
+
+
+def benchmark_stream_memory(sizes: list) -> list:
+    '''
+    Compare the peak memory of project.read_csv with that of going through the blocks
+    of the streaming mode, on files with short segments and on a file that is a single
+    segment (which can not be split over blocks).
+
+    Input: list of row counts to generate files for.
+
+    Returns list of dictionaries with the growth of the peak memory in megabytes.
+    '''
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for n_rows in sizes:
+            for segment_length in [100, n_rows]:
+                name = os.path.join(directory, f'bench_{n_rows}.csv')
+                write_random_csv(name, n_rows, segment_length)
+                results += [{
+                    'rows': n_rows, 'segment_length': segment_length,
+                    'read_csv': round(peak_memory(f'project.read_csv({name!r})') / 2 ** 20),
+                    'mmap_blocks': round(peak_memory(
+                        f'for block in project.iter_segment_blocks({name!r}): pass') / 2 ** 20)}]
+                os.remove(name)
+    return results
+
+
+def benchmark_clean_positions(sizes: list, legacy_max_segments: int) -> list:
+    '''
+    Compare the time of project._clean_positions with the original iterrows implementation.
+
+    Input: list of segment counts to generate frames for and the largest segment count
+    for which the original implementation is still timed.
+
+    Returns list of dictionaries with the time in seconds for every size.
+    '''
+    results = []
+    for n_segments in sizes:
+        df = random_dna_frame(n_segments)
+        result = {'segments': n_segments, 'rows': len(df),
+                  'clean_positions': _time(project._clean_positions, df)}
+        if n_segments <= legacy_max_segments:
+            result['legacy'] = _time(legacy_clean_positions, df)
+        results += [result]
+    return results
+
+
+def benchmark_clean_data(sizes: list, legacy_max_segments: int) -> list:
+    '''
+    Compare the time of project.clean_data with the original implementation.
+
+    Input: list of segment counts to generate frames for and the largest segment count
+    for which the original implementation is still timed.
+
+    Returns list of dictionaries with the time in seconds for every size.
+    '''
+    results = []
+    for n_segments in sizes:
+        df = random_dna_frame(n_segments)
+        result = {'segments': n_segments, 'rows': len(df),
+                  'clean_data': _time(project.clean_data, df)}
+        if n_segments <= legacy_max_segments:
+            result['legacy'] = _time(legacy_clean_data, df)
+        results += [result]
+    return results
+
+
+def benchmark_interchange(sizes: list, segment_length: int = 100) -> list:
+    '''
+    Compare the size and parse time of the records and segments JSON layouts.
+
+    Input: list of segment counts and number of positions per segment.
+
+    Returns list of dictionaries with the size in bytes and the time in seconds to read
+    the segments back (as construct_graph does) for both layouts.
+    '''
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for n_segments in sizes:
+            name = os.path.join(directory, 'interchange.csv')
+            write_random_csv(name, n_segments * segment_length, segment_length)
+            df = project.read_csv(name)
+            result = {'segments': n_segments}
+            for layout in ['records', 'segments']:
+                json_data = project.generate_sequences(df, layout)
+                result[f'{layout}_bytes'] = len(json_data)
+                result[f'{layout}_parse'] = _time(
+                    lambda: list(project._iter_dna_segments(json_data)))
+            results += [result]
+    return results
+
+
+def benchmark_construct_graph(sizes: list, workers: list) -> list:
+    '''
+    Time project.construct_graph (native) sequentially and with sharded k-mer counting.
+
+    Input: list of k-mer counts and list of worker counts to try.
+
+    Returns list of dictionaries with the time in seconds for every size.
+    '''
+    results = []
+    for n_k_mers in sizes:
+        segments = random_genome_segments(n_k_mers)
+        result = {'k_mers': n_k_mers,
+                  'sequential': _time(lambda: project.construct_graph(segments, 21, native=True))}
+        for n_workers in workers:
+            result[f'workers_{n_workers}'] = _time(
+                lambda: project.construct_graph(segments, 21, native=True, workers=n_workers))
+        results += [result]
+    return results
+
+
+def benchmark_is_valid_graph(sizes: list, legacy_max_nodes: int) -> list:
+    '''
+    Compare the time of project.is_valid_graph with the original recursive version.
+
+    Input: list of node counts and the largest node count for which the original
+    implementation is still timed (it hits the recursion limit on long paths).
+
+    Returns list of dictionaries with the time in seconds for every size.
+    '''
+    results = []
+    for n_nodes in sizes:
+        graph = random_genome_graph(n_nodes)
+        result = {'nodes': graph.number_of_nodes(),
+                  'is_valid_graph': _time(project.is_valid_graph, graph),
+                  'native': _time(project.is_valid_graph, random_genome_graph(n_nodes, native=True)),
+                  'compacted': _time(lambda graph: project.is_valid_graph(
+                      project.compact_graph(graph)), random_genome_graph(n_nodes, native=True))}
+        if n_nodes <= legacy_max_nodes:
+            result['legacy'] = _time(legacy_is_valid_graph, graph)
+        results += [result]
+    return results
+
+
+def benchmark_construct_dna_sequence(sizes: list, legacy_max_k_mers: int) -> list:
+    '''
+    Compare the time of project.construct_dna_sequence with the original matrix version.
+
+    Input: list of k-mer counts and the largest count for which the original
+    implementation is still timed (dense V x V matrix and one recursion per edge).
+
+    Returns list of dictionaries with the time in seconds for every size.
+    '''
+    results = []
+    for n_k_mers in sizes:
+        result = {'edges': n_k_mers,
+                  'construct_dna_sequence': _time(project.construct_dna_sequence,
+                                                  random_genome_graph(n_k_mers)),
+                  'native': _time(project.construct_dna_sequence,
+                                  random_genome_graph(n_k_mers, native=True)),
+                  'compacted': _time(lambda graph: project.construct_dna_sequence(
+                      project.compact_graph(graph)), random_genome_graph(n_k_mers, native=True))}
+        if n_k_mers <= legacy_max_k_mers:
+            result['legacy'] = _time(legacy_construct_dna_sequence, random_genome_graph(n_k_mers))
+        results += [result]
+    return results
+
+
+# seconds that "import project" may take, heavy dependencies are loaded by the stages
+IMPORT_TIME_BUDGET = 0.25
+
+
+def benchmark_import_time(repeat: int = 5) -> list:
+    '''
+    Measure the import time of project.py with python -X importtime.
+
+    Input: number of fresh interpreters to import project in; the fastest run is kept
+    to leave out the noise of cold caches.
+
+    Returns list of dictionaries with the cumulative import time in seconds of project
+    and of the modules it imports directly, slowest first.
+    '''
+    best = None
+    for _ in range(repeat):
+        process = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import project'],
+                                 capture_output=True, text=True, check=True,
+                                 cwd=os.path.dirname(os.path.abspath(__file__)))
+        # lines look like "import time:  self [us] | cumulative | module", indented by
+        # depth, and the modules a module imports are listed just before it
+        times, imported = {}, {}
+        for line in process.stderr.splitlines():
+            fields = line.split('|')
+            if not line.startswith('import time:') or not fields[1].strip().isdigit():
+                continue
+            module = fields[2].rstrip()
+            depth = (len(module) - len(module.lstrip())) // 2
+            if depth == 1:
+                imported[module.strip()] = int(fields[1]) / 10 ** 6
+            elif depth == 0:
+                if module.strip() == 'project':
+                    times = {'project': int(fields[1]) / 10 ** 6, **imported}
+                imported = {}
+        if best is None or times['project'] < best['project']:
+            best = times
+    return [{'module': module, 'seconds': seconds}
+            for module, seconds in sorted(best.items(), key=lambda item: -item[1])]
+
+
+def benchmark_pipeline(sizes: list, k: int = 25) -> list:
+    '''
+    Time every stage of the pipeline on sequencing data of random genomes.
+
+    Input: list of genome lengths (size tiers) and length of the k-mers.
+
+    Returns list of dictionaries with, for every genome length, the number of rows, the
+    time in seconds of every stage, the rows per second of the whole pipeline, the time
+    of the streaming mode and whether the genome was reconstructed.
+    '''
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for genome_length in sizes:
+            df, genome = sequencing_frame(genome_length, k)
+            name = os.path.join(directory, f'DNA_1_{k}.csv')
+            df.to_csv(name, header=False, index=False)
+            result = {'genome': genome_length, 'rows': len(df)}
+            stages = [('read_csv', lambda: project.read_csv(name)),
+                      ('clean_data', lambda df: project.clean_data(df, packed=True)),
+                      ('construct_graph', lambda segments: project.construct_graph(
+                          segments, k, native=True)),
+                      ('compact_graph', project.compact_graph),
+                      ('is_valid_graph', lambda graph: (graph, project.is_valid_graph(graph))),
+                      ('construct_dna_sequence', lambda checked: checked[1] and
+                       project.construct_dna_sequence(checked[0]))]
+            output = ()
+            for stage, function in stages:
+                start = time.perf_counter()
+                output = function(*output)
+                result[stage] = time.perf_counter() - start
+                output = (output,)
+            result['rows_per_second'] = round(len(df) / sum(result[stage] for stage, _ in stages))
+            result['streaming'] = _time(lambda: project.construct_graph_streaming(
+                name, k, native=True))
+            result['correct'] = output[0] == genome
+            results += [result]
+    return results
+
+
+def _default(value, default):
+    '''Returns value, or default if the option was not given (None, unlike 0).'''
+    return default if value is None else value
+
+
+def _print_results(results: list) -> None:
+    '''Print the benchmark results as a table with one row per size.'''
+    for result in results:
+        print(', '.join(f'{key}={value:,.3f}' if isinstance(value, float)
+                        else f'{key}={value:,}' if isinstance(value, int)
+                        and not isinstance(value, bool)
+                        else f'{key}={value}' for key, value in result.items()))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('benchmark', choices=['read_csv', 'clean_positions', 'clean_data',
+                                              'stream_memory', 'interchange',
+                                              'construct_graph',
+                                              'is_valid_graph',
+                                              'construct_dna_sequence', 'import_time',
+                                              'pipeline'])
+    parser.add_argument('--sizes', type=int, nargs='+',
+                        help='rows (read_csv) or segments (other benchmarks) per run')
+    parser.add_argument('--legacy-max', type=int,
+                        help='largest size for which the original implementation is timed')
+    parser.add_argument('--workers', type=int, nargs='+',
+                        help='worker counts for the sharded construct_graph')
+    arguments = parser.parse_args()
+
+    if arguments.benchmark == 'read_csv':
+        print('rows/sec per implementation')
+        _print_results(benchmark_read_csv(
+            arguments.sizes or [10 ** 5, 10 ** 6, 10 ** 7],
+            _default(arguments.legacy_max, 10 ** 6)))
+    elif arguments.benchmark == 'stream_memory':
+        print('growth of the peak memory in MB per reader')
+        _print_results(benchmark_stream_memory(arguments.sizes or [10 ** 6, 3 * 10 ** 6]))
+    elif arguments.benchmark == 'clean_positions':
+        print('seconds per implementation')
+        _print_results(benchmark_clean_positions(
+            arguments.sizes or [10 ** 3, 10 ** 4, 10 ** 5],
+            _default(arguments.legacy_max, 10 ** 4)))
+    elif arguments.benchmark == 'clean_data':
+        print('seconds per implementation')
+        _print_results(benchmark_clean_data(
+            arguments.sizes or [10 ** 3, 10 ** 4, 10 ** 5],
+            _default(arguments.legacy_max, 10 ** 3)))
+    elif arguments.benchmark == 'interchange':
+        print('JSON size in bytes and seconds to parse per layout')
+        _print_results(benchmark_interchange(
+            arguments.sizes or [10 ** 2, 10 ** 3, 10 ** 4]))
+    elif arguments.benchmark == 'construct_graph':
+        print('seconds per number of workers')
+        _print_results(benchmark_construct_graph(
+            arguments.sizes or [10 ** 5, 10 ** 6, 10 ** 7],
+            arguments.workers or [2, os.cpu_count() or 1]))
+    elif arguments.benchmark == 'is_valid_graph':
+        print('seconds per implementation')
+        _print_results(benchmark_is_valid_graph(
+            arguments.sizes or [3 * 10 ** 2, 10 ** 5, 10 ** 6],
+            _default(arguments.legacy_max, 3 * 10 ** 2)))
+    elif arguments.benchmark == 'construct_dna_sequence':
+        print('seconds per implementation')
+        _print_results(benchmark_construct_dna_sequence(
+            arguments.sizes or [3 * 10 ** 2, 10 ** 5, 10 ** 6],
+            _default(arguments.legacy_max, 3 * 10 ** 2)))
+    elif arguments.benchmark == 'pipeline':
+        print('seconds per stage on a genome with all error classes')
+        _print_results(benchmark_pipeline(arguments.sizes or [10 ** 4, 10 ** 5, 10 ** 6]))
+    elif arguments.benchmark == 'import_time':
+        print(f'import time in seconds (budget {IMPORT_TIME_BUDGET} s)')
+        results = benchmark_import_time()
+        _print_results(results)
+        if results[0]['seconds'] > IMPORT_TIME_BUDGET:
+            sys.exit(f"import project took {results[0]['seconds']:.3f} s, "
+                     f"over the budget of {IMPORT_TIME_BUDGET} s")
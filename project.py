@@ -2,44 +2,66 @@
 author: Elisa Verhofstadt
 studentnumber: 2261793
 """
-import networkx as nx
-import pandas as pd
+from __future__ import annotations
+
 import numpy as np
-import matplotlib.pyplot as plt
 import json
-from typing import List
+from typing import TYPE_CHECKING, Iterable, Iterator
+import argparse
+import contextlib
+import glob
+import hashlib
+import os
+import shutil
 import sys
+import time
+from functools import partial
+
+# pandas, networkx and multiprocessing take most of the import time, so they are
+# imported in the functions that use them and only loaded by the stages that need them
+if TYPE_CHECKING:
+    import networkx as nx
+    import pandas as pd
+
+# columns of the csv file and the compact dtypes used to store them
+_COLUMNS = ['SegmentNr', 'Position', 'A', 'C', 'G', 'T']
+_CSV_DTYPES = {'SegmentNr': np.int32, 'Position': np.int32,
+               'A': np.int8, 'C': np.int8, 'G': np.int8, 'T': np.int8}
 
 # read the csv file given its name
 
 
 def read_csv(name: str) -> pd.DataFrame:
-    '''Read in csv file and returns pandas DataFrame of the same information'''
-    with open(name, mode='r') as dna_file:
-        # every reading as string in a list
-        df_as_list = dna_file.readlines()
+    '''
+    Read in csv file and returns pandas DataFrame of the same information.
+
+    Input: name of the csv file (no header, six integer columns per row).
 
-        # turn strings into lists of values
-        for index_r, reading in enumerate(df_as_list):
-            # split values, remove whitespace
-            df_as_list[index_r] = reading.strip().split(',')
-            # record every value as integers
-            for index_v, value in enumerate(df_as_list[index_r]):
-                df_as_list[index_r][index_v] = eval(value)
+    Returns DataFrame with columns SegmentNr, Position, A, C, G, T.
 
-        # return list of lists as pandas DataFrame
-        return pd.DataFrame(df_as_list, columns=[
-            'SegmentNr', 'Position', 'A', 'C', 'G', 'T'])
+    All values are parsed in bulk by the C parser of pandas straight into
+    typed columns (int32 for segment and position, int8 for the nucleotides),
+    no value is interpreted one by one.
+    '''
+    import pandas as pd
+    try:
+        return pd.read_csv(name, header=None, names=_COLUMNS, dtype=_CSV_DTYPES,
+                           skipinitialspace=True, engine='c')
+    except pd.errors.EmptyDataError:
+        # an empty file has no rows, but the columns should still be typed
+        return pd.DataFrame({column: pd.Series(dtype=dtype)
+                             for column, dtype in _CSV_DTYPES.items()})
 
 
 # Clean the dataframe
-def clean_data(df: pd.DataFrame) -> pd.DataFrame:
+def clean_data(df: pd.DataFrame, packed: bool = False):
     '''
     Filter out specified mistakes in the input DataFrame related to segments and positions.
 
-    Input: DataFrame to be cleaned.
+    Input: DataFrame to be cleaned and whether to return the segments as packed sequences.
 
-    Returns cleaned DataFrame without the specified errors.
+    Returns cleaned DataFrame without the specified errors, or if packed is True a
+    dictionary with a PackedSequence for every remaining segment number.
 
     The function applies a series of checks and cleaning operations to remove the identified errors.
     It returns a new DataFrame that excludes the prespecified mistakes.
@@ -50,6 +72,18 @@ def clean_data(df: pd.DataFrame) -> pd.DataFrame:
     # check for double occurring segments
     to_remove_segment = _clean_segments(df, to_remove_segment)
 
+    df = _remove_segments(df, to_remove_segment)
+    if packed:
+        return pack_segments(df)
+    return df
+
+
+def _remove_segments(df: pd.DataFrame, to_remove_segment: list) -> pd.DataFrame:
+    '''
+    Input: DataFrame and list of segment numbers to remove.
+
+    Returns DataFrame without the rows of these segments, with a new index.
+    '''
     # remove selected segments
     df = df.query('SegmentNr not in @to_remove_segment')
     # reset index as several segments or positions have been removed
@@ -64,49 +98,86 @@ def _clean_positions(df: pd.DataFrame):
 
     Returns a cleaned DataFrame (in function of positions) and a list of segments to be removed.
 
+    The rows are walked per segment (segments in order of first appearance, rows in file
+    order). A position higher than expected is missing data, a lower one is a duplicate
+    that is dropped if it equals the row before and discards the segment otherwise, and
+    a row at the expected position needs exactly one 1 (no all zeros or multiple ones).
+    All checks are done on NumPy arrays of the whole frame at once, only segments whose
+    positions do not simply count up from 1 are walked row by row.
     '''
-    # identify all the unique sequence numbers
-    segments = df['SegmentNr'].unique()
-
-    # for each segment check if all positions are included
-    to_remove_index = []
-    to_remove_segment = []
-
-    index = 0
-    for segment in segments:
-        segment_index = 0
-        position_count = 1
-
-        # select df of all positions of this segment
-        segment_df = df[df['SegmentNr'] == segment]
-
-        # go through each position in a segment and do the necessary checks
-        for _, row in segment_df.iterrows():
-            # indicates missing position, e.g. 1, 2, 4, 5
-            if (row['Position'] > position_count) and row['SegmentNr'] not in to_remove_segment:
-                to_remove_segment += [row['SegmentNr']]
-            # indicated duplicate position, e.g. 1, 2, 2, 3
-            elif row['Position'] < position_count:
-                # check whether duplicate positions have equal values
-                if list(segment_df.iloc[segment_index - 1]) == list(row):
-                    # same information, remove one of the positions
-                    to_remove_index += [index]
-                elif row['SegmentNr'] not in to_remove_segment:
-                    # different information, discard segment
-                    to_remove_segment += [row['SegmentNr']]
-            else:  # correct position
-                # check for errors in every row (all zeros or multiple ones)
-                # select all zero and one values for one entry
-                values = list(row[['A', 'C', 'G', 'T']])
-                if (not any(values) or values.count(1) > 1) and row['SegmentNr'] not in to_remove_segment:
-                    to_remove_segment += [row['SegmentNr']]
-                position_count += 1
-            index += 1
-            segment_index += 1
+    import pandas as pd
+    if df.empty:
+        return df, []
+
+    # order rows by segment (in order of first appearance), keep file order within a segment
+    segment_codes, segments = pd.factorize(df['SegmentNr'])
+    order = np.argsort(segment_codes, kind='stable')
+    segment_codes = segment_codes[order]
+    positions = df['Position'].to_numpy()[order]
+    values = df[['A', 'C', 'G', 'T']].to_numpy()[order]
+
+    # index of the first row of every segment
+    is_first = np.ones(len(order), dtype=bool)
+    is_first[1:] = segment_codes[1:] != segment_codes[:-1]
+    starts = np.flatnonzero(is_first)
+
+    # regular segments start at position 1 and only go up by one or repeat the position
+    step = positions - np.concatenate(([0], positions[:-1]))
+    step[is_first] = positions[is_first]
+    repeated = (step == 0) & ~is_first
+    regular = np.logical_and.reduceat((step == 1) | repeated, starts)
+
+    # duplicate position, e.g. 1, 2, 2, 3: equal to the row before or not
+    equal_to_previous = np.zeros(len(order), dtype=bool)
+    equal_to_previous[1:] = (values[1:] == values[:-1]).all(axis=1)
+    drop_row = repeated & equal_to_previous
+    # correct position: all zeros or multiple ones
+    wrong_value = ~values.any(axis=1) | ((values == 1).sum(axis=1) > 1)
+    wrong_row = (repeated & ~equal_to_previous) | (~repeated & wrong_value)
+    wrong_segment = np.logical_or.reduceat(wrong_row, starts)
+
+    # segments with missing or unordered positions are walked row by row
+    ends = np.concatenate((starts[1:], [len(order)]))
+    for segment in np.flatnonzero(~regular):
+        segment_rows = slice(starts[segment], ends[segment])
+        drop_row[segment_rows], wrong_segment[segment] = _clean_irregular_segment(
+            positions[segment_rows], values[segment_rows])
+
     # remove selected positions within segments
-    df = df.drop(to_remove_index)
+    keep_row = np.ones(len(order), dtype=bool)
+    keep_row[order[drop_row]] = False
+    return df[keep_row], segments[wrong_segment].tolist()
+
+
+def _clean_irregular_segment(positions: np.ndarray, values: np.ndarray):
+    '''
+    Check the positions of a single segment one row at a time.
 
-    return df, to_remove_segment
+    Input: positions and A, C, G, T values of the rows of one segment, in file order.
+
+    Returns boolean array of rows to drop and whether the segment has to be removed.
+    '''
+    drop_row = np.zeros(len(positions), dtype=bool)
+    wrong_segment = False
+    position_count = 1
+    for index, position in enumerate(positions):
+        # indicates missing position, e.g. 1, 2, 4, 5
+        if position > position_count and not wrong_segment:
+            wrong_segment = True
+        # indicated duplicate position, e.g. 1, 2, 2, 3
+        elif position < position_count:
+            # compare with the row before (the last row for the first row of the segment)
+            if positions[index - 1] == position and (values[index - 1] == values[index]).all():
+                drop_row[index] = True
+            else:
+                wrong_segment = True
+        else:
+            # correct position, or a later position in a segment that is already
+            # removed: both count as the next position
+            if not values[index].any() or (values[index] == 1).sum() > 1:
+                wrong_segment = True
+            position_count += 1
+    return drop_row, wrong_segment
 
 
 def _clean_segments(df: pd.DataFrame, to_remove_segment: list) -> list:
@@ -116,78 +187,489 @@ def _clean_segments(df: pd.DataFrame, to_remove_segment: list) -> list:
     Input: DataFrame containing segment information and list of segments to be removed.
 
     Returns an updated list of segments to be removed.
+
+    Segments are grouped on a fingerprint of their A, C, G, T values, so every segment
+    is only hashed once. Segments with the same fingerprint are compared value by value,
+    so a hash collision never removes a segment. Of every group of equal segments all
+    copies but the last one are removed.
     '''
-    segments = df['SegmentNr'].unique()
-    segment_list = []
-    for segment in segments:
-        # for each segment make list of lists with every measurement,
-        # don't include segment number
-        segment_list += [df.query('SegmentNr == @segment')
-                         [['A', 'C', 'G', 'T']].values.tolist()]
-
-    # make sure that for every combination of entries is only counted once
-    for index, list_values in enumerate(segment_list):
-        if segment_list.count(list_values) > 1:
-            # record the segment number
-            to_remove_segment += [segments[index]]
-            # remove it from the list such that it will not be removed twice
-            segment_list[index] = ''
+    import pandas as pd
+    if df.empty:
+        return to_remove_segment
+
+    # rows of every segment next to each other, segments in order of first appearance
+    segment_codes, segments = pd.factorize(df['SegmentNr'])
+    order = np.argsort(segment_codes, kind='stable')
+    values = df[['A', 'C', 'G', 'T']].to_numpy()[order]
+    ends = np.cumsum(np.bincount(segment_codes))
+    starts = ends - np.bincount(segment_codes)
+
+    # group the segments on the fingerprint of their values
+    same_fingerprint = {}
+    for segment, (start, end) in enumerate(zip(starts, ends)):
+        fingerprint = _segment_fingerprint(values[start:end])
+        same_fingerprint.setdefault(fingerprint, []).append(segment)
+
+    duplicate = np.zeros(len(segments), dtype=bool)
+    for candidates in same_fingerprint.values():
+        if len(candidates) == 1:
+            continue
+        # verify the values and keep only the last copy of every group of equal segments
+        duplicate[candidates] = True
+        duplicate[_last_copies([(segment, values[starts[segment]:ends[segment]])
+                                for segment in candidates])] = False
+
+    # record the segment numbers
+    to_remove_segment += segments[duplicate].tolist()
     return to_remove_segment
 
 
+def _last_copies(copies: list) -> list:
+    '''
+    Input: list of (segment, A, C, G, T values) pairs of segments with the same
+    fingerprint, in order of first appearance.
+
+    Returns the segments that are not equal (value by value) to a later copy.
+    '''
+    return [segment for index, (segment, values) in enumerate(copies)
+            if not any(np.array_equal(values, later_values)
+                       for _, later_values in copies[index + 1:])]
+
+
+def _segment_fingerprint(values: np.ndarray) -> bytes:
+    '''
+    Compute a digest of the nucleotide values of one segment.
+
+    Input: array with the A, C, G, T values of the rows of a single segment.
+
+    Returns 128 bit digest, equal for segments with identical values.
+    '''
+    values = np.ascontiguousarray(values, dtype=np.int8)
+    return hashlib.blake2b(values.tobytes(), digest_size=16).digest()
+
+
+# Compact representation of the DNA segments
+
+_NUCLEOTIDES = 'ACGT'
+
+
+class PackedSequence:
+    '''
+    DNA sequence stored with 2 bits per nucleotide (A=0, C=1, G=2, T=3) in a byte array.
+
+    Positions that do not hold exactly one nucleotide (all zeros or multiple ones) are
+    stored as A and flagged in a bit packed mask, which is only kept if there are any.
+    '''
+    __slots__ = ('_packed', '_invalid', '_length')
+
+    def __init__(self, codes: np.ndarray, invalid: np.ndarray = None):
+        '''
+        Input: array with the code (0 to 3) of every nucleotide and optionally a boolean
+        array flagging the invalid positions.
+        '''
+        codes = np.asarray(codes, dtype=np.uint8)
+        self._length = len(codes)
+        # pad to a multiple of 4 nucleotides and store 4 nucleotides per byte
+        padded = np.zeros(-(-self._length // 4) * 4, dtype=np.uint8)
+        padded[:self._length] = codes
+        self._packed = (padded[0::4] << 6) | (padded[1::4] << 4) | (
+            padded[2::4] << 2) | padded[3::4]
+        if invalid is not None and np.any(invalid):
+            self._invalid = np.packbits(invalid)
+        else:
+            self._invalid = None
+
+    @classmethod
+    def from_one_hot(cls, values: np.ndarray) -> 'PackedSequence':
+        '''
+        Input: array with the A, C, G, T values (one row per position).
+
+        Returns the packed sequence, rows without exactly one 1 are flagged invalid.
+        '''
+        is_one = np.asarray(values).reshape(-1, 4) == 1
+        return cls(is_one.argmax(axis=1), is_one.sum(axis=1) != 1)
+
+    @classmethod
+    def from_string(cls, dna_str: str) -> 'PackedSequence':
+        '''
+        Input: DNA string of the letters A, C, G and T.
+
+        Returns the packed sequence, any other letter (e.g. N) is an invalid position.
+        '''
+        lookup = np.full(256, 4, dtype=np.uint8)
+        lookup[np.frombuffer(_NUCLEOTIDES.encode(), dtype=np.uint8)] = range(4)
+        codes = lookup[np.frombuffer(dna_str.encode(), dtype=np.uint8)]
+        invalid = codes == 4
+        codes[invalid] = 0
+        return cls(codes, invalid)
+
+    @classmethod
+    def from_packed(cls, packed: np.ndarray, length: int,
+                    invalid_bits: np.ndarray = None) -> 'PackedSequence':
+        '''
+        Input: the packed bytes (4 nucleotides per byte), number of nucleotides and
+        optionally the bit packed mask of invalid positions, as stored by another
+        PackedSequence (e.g. memory mapped arrays of the cache).
+
+        Returns the packed sequence, without copying the arrays.
+        '''
+        sequence = cls.__new__(cls)
+        sequence._packed = packed
+        sequence._length = length
+        sequence._invalid = invalid_bits if invalid_bits is not None and len(invalid_bits) else None
+        return sequence
+
+    def codes(self) -> np.ndarray:
+        '''Returns array with the code (0 to 3) of every nucleotide.'''
+        shifts = np.array([6, 4, 2, 0], dtype=np.uint8)
+        return ((self._packed[:, None] >> shifts) & 3).reshape(-1)[:self._length]
+
+    def invalid(self) -> np.ndarray:
+        '''Returns boolean array flagging the positions without a single nucleotide.'''
+        if self._invalid is None:
+            return np.zeros(self._length, dtype=bool)
+        return np.unpackbits(self._invalid, count=self._length).astype(bool)
+
+    @property
+    def nbytes(self) -> int:
+        '''Number of bytes used to store the sequence and the mask.'''
+        return self._packed.nbytes + (0 if self._invalid is None else self._invalid.nbytes)
+
+    def __len__(self) -> int:
+        return self._length
+
+    def __str__(self) -> str:
+        '''DNA string of the sequence, invalid positions are written as N.'''
+        letters = np.frombuffer(_NUCLEOTIDES.encode(), dtype=np.uint8)[self.codes()]
+        letters[self.invalid()] = ord('N')
+        return letters.tobytes().decode()
+
+    def __repr__(self) -> str:
+        return f"PackedSequence('{self}')"
+
+    def __eq__(self, other) -> bool:
+        return (isinstance(other, PackedSequence) and self._length == other._length
+                and np.array_equal(self._packed, other._packed)
+                and np.array_equal(self.invalid(), other.invalid()))
+
+
+def pack_segments(df: pd.DataFrame) -> dict:
+    '''
+    Convert the rows of every segment in the DataFrame into a packed sequence.
+
+    Input: DataFrame with columns SegmentNr, Position, A, C, G, T (rows in position order).
+
+    Returns dictionary with a PackedSequence per segment number, in order of first appearance.
+    '''
+    import pandas as pd
+    if df.empty:
+        return {}
+    segment_codes, segments = pd.factorize(df['SegmentNr'])
+    order = np.argsort(segment_codes, kind='stable')
+    is_one = df[['A', 'C', 'G', 'T']].to_numpy()[order] == 1
+    codes = is_one.argmax(axis=1)
+    invalid = is_one.sum(axis=1) != 1
+    ends = np.cumsum(np.bincount(segment_codes))
+    starts = ends - np.bincount(segment_codes)
+    return {segment_nr: PackedSequence(codes[start:end], invalid[start:end])
+            for segment_nr, start, end in zip(segments.tolist(), starts, ends)}
+
+
 # Generate JSON sequences from the dataframe
 
-def generate_sequences(df: pd.DataFrame) -> str:
+def generate_sequences(df: pd.DataFrame, layout: str = 'records') -> str:
     '''
     Convert the input DataFrame to a JSON string representation.
 
-    Input: DataFrame containing sequences.
+    Input: DataFrame containing sequences and the layout of the JSON: 'records' holds
+    one object per position, 'segments' one object per segment with its DNA string
+    (invalid positions written as N), which is many times smaller.
 
     Returns SON string representation of the DataFrame.
     '''
+    if layout == 'segments':
+        return json.dumps([{'SegmentNr': segment_nr, 'Sequence': str(packed_sequence)}
+                           for segment_nr, packed_sequence in pack_segments(df).items()],
+                          separators=(',', ':'))
+    if layout != 'records':
+        raise ValueError(f"unknown layout '{layout}', use 'records' or 'segments'")
     return df.to_json(indent=0, orient='records')
 
 
 # Construct de Bruijn graph
 
-def construct_graph(json_data: str, k: int) -> nx.MultiDiGraph:
+def construct_graph(json_data, k: int, native: bool = False, workers: int = None,
+                    min_abundance: int = 1):
     ''' 
     Construct a de Bruijn graph from the DNA sequences provided in JSON format.
 
-    Input: JSON string representing the DNA sequences and
-    length of k-mers to be used in constructing the graph.
+    Input: the DNA sequences, either as JSON string, as cleaned DataFrame or as the
+    dictionary of packed sequences from clean_data, length of k-mers to be used in
+    constructing the graph, whether to build the array based DeBruijnGraph
+    instead of a networkx graph, the number of worker processes and the number of
+    times a k-mer has to occur to be used.
 
     Returns the constructed de Bruijn graph.
+
+    Segments are added in order of segment number. The DataFrame and the packed
+    sequences are used as they are, JSON is only needed to exchange data between
+    processes or files. With more than one worker the k-mers of groups of segments
+    are counted in parallel and merged, which gives the same graph. K-mers that occur
+    less than min_abundance times (e.g. the k-mers around a sequencing error, when the
+    segments overlap more than once) are left out of the graph.
     '''
-    # initiate graph
-    de_Bruij_G = nx.MultiDiGraph()
+    return _graph_from_segments(_iter_dna_segments(json_data), k, native, workers, min_abundance)
+
+
+def _iter_dna_segments(json_data) -> Iterator:
+    '''
+    Iterate over the segments in the input of construct_graph.
+
+    Input: JSON string (records or segments layout), DataFrame or dictionary of
+    packed sequences.
+
+    Yields the DNA string or PackedSequence of every segment, in order of segment number.
+    '''
+    # a DataFrame can only be given if pandas was loaded already
+    if 'pandas' in sys.modules and isinstance(json_data, sys.modules['pandas'].DataFrame):
+        json_data = pack_segments(json_data)
+    # packed sequences can be used directly
+    if isinstance(json_data, dict):
+        for segment_nr in sorted(json_data):
+            yield json_data[segment_nr]
+        return
 
     # turn json object into dictionary
     dna_dict = json.loads(json_data)
 
+    # segments layout: one entry with the DNA string per segment
+    if dna_dict and 'Sequence' in dna_dict[0]:
+        for segment in sorted(dna_dict, key=lambda segment: segment['SegmentNr']):
+            yield PackedSequence.from_string(segment['Sequence'])
+        return
+
     # dna_dict is now list with dict for each entry
-    # select all segment numbers
-    segment_nrs = set([position['SegmentNr'] for position in dna_dict])
-    # add nodes for each sequence
-    for segment_nr in segment_nrs:
-        # reconstruct DNA structure single segment
-        single_segment = [
-            position for position in dna_dict if position['SegmentNr'] == segment_nr]
-        dna_str = _get_dna_string(single_segment)
+    # collect the positions of every segment in one pass
+    segments = {}
+    for position in dna_dict:
+        segments.setdefault(position['SegmentNr'], []).append(position)
+    # reconstruct DNA structure of each segment
+    for segment_nr in sorted(segments):
+        yield _get_dna_string(segments[segment_nr])
 
-        # get all k-mers
-        k_mer_list = _generate_k_mers(dna_str, k)
 
-        # for each k-mer get two (k-1) mers -> L and R
-        for k_mer in k_mer_list:
-            left = k_mer[:-1]  # L
-            right = k_mer[1:]  # R
+def _graph_from_segments(segments: Iterable, k: int, native: bool, workers: int = None,
+                         min_abundance: int = 1):
+    '''
+    Build the de Bruijn graph of the k-mers of all segments.
+
+    Input: DNA strings or PackedSequences of the segments, length of the k-mers,
+    whether to build a DeBruijnGraph instead of a networkx graph, the number of
+    worker processes and the number of times a k-mer has to occur to be used.
 
-            # for each L and R add a node and edge from left to right
-            de_Bruij_G.add_edge(left, right)
+    Returns the constructed de Bruijn graph.
+    '''
+    table = None
+    if workers is not None and workers > 1 and k <= _MAX_ENCODED_K:
+        segments = list(segments)
+        if len(segments) > 1:
+            table = _sharded_k_mer_counts(segments, k, workers)
+    if table is None and (native or min_abundance > 1):
+        table = _count_k_mers(segments, k)
+    if table is not None:
+        graph = DeBruijnGraph.from_k_mer_counts(*_filter_k_mer_counts(*table, min_abundance), k)
+        if native:
+            return graph
+        return graph.to_networkx()
+    import networkx as nx
+    # initiate graph
+    de_Bruij_G = nx.MultiDiGraph()
+    for dna_data in segments:
+        _add_segment_edges(de_Bruij_G, dna_data, k)
     return de_Bruij_G
 
 
+def _add_segment_edges(graph: nx.MultiDiGraph, dna_data, k: int) -> None:
+    '''
+    Add the k-mers of a single segment as edges to the de Bruijn graph.
+
+    Input: graph to add the edges to, DNA string or PackedSequence of one segment
+    and length of the k-mers.
+    '''
+    if k > _MAX_ENCODED_K:
+        # too long to encode in 64 bits, slice the DNA string instead
+        if isinstance(dna_data, PackedSequence):
+            dna_data = _get_dna_string(dna_data)
+        for k_mer in _generate_k_mers(dna_data, k):
+            graph.add_edge(k_mer[:-1], k_mer[1:])
+        return
+
+    if not isinstance(dna_data, PackedSequence):
+        dna_data = PackedSequence.from_string(dna_data)
+    # for each k-mer get two (k-1) mers -> L and R
+    _, lefts, rights = _encode_k_mers(dna_data.codes(), k, dna_data.invalid())
+    # every distinct (k-1)-mer is only decoded once
+    nodes, node_ids = np.unique(np.concatenate((lefts, rights)), return_inverse=True)
+    labels = _decode_k_mers(nodes, k - 1)
+    # for each L and R add a node and edge from left to right
+    graph.add_edges_from(zip([labels[node_id] for node_id in node_ids[:len(lefts)]],
+                             [labels[node_id] for node_id in node_ids[len(lefts):]]))
+
+
+# longest k-mer that fits in an unsigned 64 bit integer
+_MAX_ENCODED_K = 32
+
+
+def _encode_k_mers(codes: np.ndarray, k: int, invalid: np.ndarray = None):
+    '''
+    Encode all k-mers of one segment as integers with 2 bits per nucleotide.
+
+    Input: array with the code (0 to 3) of every nucleotide, length of the k-mers
+    (at most 32) and optionally a boolean array flagging invalid positions.
+
+    Returns three uint64 arrays: the k-mers and their left and right (k-1)-mers.
+    K-mers that overlap an invalid position are left out.
+    '''
+    codes = np.asarray(codes, dtype=np.uint64)
+    n_k_mer = max(len(codes) - k + 1, 0)
+    # shift in one nucleotide at a time for all k-mers at once
+    k_mers = np.zeros(n_k_mer, dtype=np.uint64)
+    for offset in range(k):
+        k_mers = (k_mers << np.uint64(2)) | codes[offset:offset + n_k_mer]
+    if invalid is not None and n_k_mer and np.any(invalid):
+        # number of invalid positions in every window of length k
+        invalid_count = np.concatenate(([0], np.cumsum(invalid)))
+        k_mers = k_mers[invalid_count[k:] == invalid_count[:n_k_mer]]
+    left = k_mers >> np.uint64(2)
+    right = k_mers & np.uint64((1 << (2 * (k - 1))) - 1)
+    return k_mers, left, right
+
+
+def _decode_k_mers(k_mers: np.ndarray, k: int) -> list:
+    '''
+    Decode integer encoded k-mers back into DNA strings.
+
+    Input: array of encoded k-mers and their length.
+
+    Returns list of DNA strings.
+    '''
+    shifts = np.arange(2 * (k - 1), -1, -2, dtype=np.uint64)
+    codes = (np.asarray(k_mers, dtype=np.uint64)[:, None] >> shifts) & np.uint64(3)
+    letters = np.frombuffer(_NUCLEOTIDES.encode(), dtype=np.uint8)[codes]
+    return [row.tobytes().decode() for row in letters]
+
+
+def _count_k_mers(segments: Iterable, k: int):
+    '''
+    Count the k-mers of a list of segments.
+
+    Input: DNA strings or PackedSequences of the segments and length of the k-mers.
+
+    Returns two arrays: the distinct k-mers in order of first appearance (encoded, or
+    strings if k is larger than 32) and how often every k-mer occurs.
+    '''
+    if k > _MAX_ENCODED_K:
+        k_mer_arrays = [np.zeros(0, dtype=object)]
+        for dna_data in segments:
+            if isinstance(dna_data, PackedSequence):
+                dna_data = _get_dna_string(dna_data)
+            k_mer_arrays += [np.array(_generate_k_mers(dna_data, k), dtype=object)]
+        return _count_values(np.concatenate(k_mer_arrays))
+    k_mer_arrays = [np.zeros(0, dtype=np.uint64)]
+    for dna_data in segments:
+        if not isinstance(dna_data, PackedSequence):
+            dna_data = PackedSequence.from_string(dna_data)
+        k_mer_arrays += [_encode_k_mers(dna_data.codes(), k, dna_data.invalid())[0]]
+    return _count_values(np.concatenate(k_mer_arrays))
+
+
+def _count_values(k_mers: np.ndarray):
+    '''
+    Input: array of encoded k-mers (or k-mer strings).
+
+    Returns the distinct k-mers in order of first appearance and how often each occurs.
+    '''
+    import pandas as pd
+    k_mer_ids, distinct = pd.factorize(k_mers)
+    return (np.asarray(distinct, dtype=k_mers.dtype),
+            np.bincount(k_mer_ids, minlength=len(distinct)))
+
+
+def _filter_k_mer_counts(k_mers: np.ndarray, counts: np.ndarray, min_abundance: int = 1):
+    '''
+    Input: distinct k-mers, how often every k-mer occurs and the least number of times
+    a k-mer has to occur.
+
+    Returns the k-mers and counts of the k-mers that occur often enough, in the same order.
+    '''
+    if min_abundance <= 1:
+        return k_mers, counts
+    keep = counts >= min_abundance
+    return k_mers[keep], counts[keep]
+
+
+def count_k_mers(json_data, k: int, min_abundance: int = 1) -> pd.DataFrame:
+    '''
+    Count how often every k-mer occurs in the DNA sequences.
+
+    Input: the DNA sequences in any form construct_graph accepts, length of the k-mers
+    and the least number of times a k-mer has to occur to be listed.
+
+    Returns DataFrame with columns KMer and Count, one row per distinct k-mer in order
+    of first appearance (segments in order of segment number). Every k-mer is one edge
+    of the de Bruijn graph, with Count as its multiplicity.
+
+    The k-mers are encoded as integers (2 bits per nucleotide) and counted in bulk,
+    they are only turned into strings for the table.
+    '''
+    import pandas as pd
+    k_mers, counts = _filter_k_mer_counts(
+        *_count_k_mers(_iter_dna_segments(json_data), k), min_abundance)
+    if k <= _MAX_ENCODED_K:
+        k_mers = _decode_k_mers(k_mers, k)
+    return pd.DataFrame({'KMer': pd.Series(list(k_mers), dtype=object),
+                         'Count': pd.Series(counts, dtype=np.int64)})
+
+
+def _merge_k_mer_counts(tables: list):
+    '''
+    Merge the k-mer counts of consecutive groups of segments.
+
+    Input: list of (k-mers, counts) pairs from _count_k_mers, in segment order.
+
+    Returns the distinct k-mers of all groups in order of first appearance and their
+    total counts, the same as counting all segments at once.
+    '''
+    import pandas as pd
+    k_mers = np.concatenate([np.zeros(0, dtype=np.uint64)] + [table[0] for table in tables])
+    counts = np.concatenate([np.zeros(0, dtype=np.int64)] + [table[1] for table in tables])
+    k_mer_ids, merged = pd.factorize(k_mers)
+    total = np.zeros(len(merged), dtype=np.int64)
+    np.add.at(total, k_mer_ids, counts)
+    return np.asarray(merged, dtype=np.uint64), total
+
+
+def _sharded_k_mer_counts(segments: list, k: int, workers: int):
+    '''
+    Count the k-mers of all segments in worker processes.
+
+    Input: list of DNA strings or PackedSequences, length of the k-mers (at most 32)
+    and number of worker processes.
+
+    Returns the same k-mers and counts as _count_k_mers on all segments.
+    '''
+    # a few shards per worker with about the same number of nucleotides, so a slow
+    # shard does not keep the other workers waiting; shards stay in segment order
+    n_shards = min(4 * workers, len(segments))
+    ends = np.cumsum([len(dna_data) for dna_data in segments])
+    bounds = [0] + list(np.searchsorted(ends, ends[-1] * np.arange(1, n_shards) / n_shards,
+                                        side='right')) + [len(segments)]
+    shards = [segments[begin:end] for begin, end in zip(bounds[:-1], bounds[1:]) if end > begin]
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return _merge_k_mer_counts(list(pool.map(partial(_count_k_mers, k=k), shards)))
+
+
 def _generate_k_mers(dna_str: str, k: int) -> list:
     '''
     Generate k-mers from the given DNA string.
@@ -197,29 +679,19 @@ def _generate_k_mers(dna_str: str, k: int) -> list:
 
     Returns a list of generated k-mers.
     '''
-    k_mers = []
-    # determine how many k-mers we will return
-    n_k_mer = len(dna_str) - k + 1
+    return [dna_str[n_begin:n_begin + k] for n_begin in range(len(dna_str) - k + 1)]
 
-    # slice dna_str n_k_mer times, each time changing one place
-    n_begin = 0
-    n_end = len(dna_str) - n_k_mer + 1
-    for _ in range(n_k_mer):
-        k_mers += [dna_str[n_begin:n_end]]
-        # update slicers
-        n_begin += 1
-        n_end += 1
-    return k_mers
 
-
-def _get_dna_string(dna_data: List[dict]) -> str:
+def _get_dna_string(dna_data) -> str:
     '''
     Retrieve the DNA string from the given DNA data.
 
-    Input: list of dictionaries representing DNA data.
+    Input: list of dictionaries representing DNA data, or a PackedSequence.
 
     Returns DNA string extracted from the DNA data.
     '''
+    if isinstance(dna_data, PackedSequence):
+        return str(dna_data)
     dna_str = []
     # loop through all positions
     for line in dna_data:
@@ -230,20 +702,1059 @@ def _get_dna_string(dna_data: List[dict]) -> str:
     return ''.join(dna_str)
 
 
+# Array based de Bruijn graph
+
+class DeBruijnGraph:
+    '''
+    De Bruijn graph stored in arrays instead of dictionaries of networkx.
+
+    Nodes are numbered in order of first appearance, like the nodes of the networkx graph.
+    The edges are stored in compressed sparse row form: the edges leaving node i are
+    targets[offsets[i]:offsets[i + 1]], sorted on end node, and every distinct edge has
+    a multiplicity. In and out degrees (counting multiplicity) are kept per node.
+    Node names are only decoded from the 2-bit encoded (k-1)-mers when asked for.
+    '''
+
+    def __init__(self, nodes: np.ndarray, sources: np.ndarray, targets: np.ndarray,
+                 multiplicity: np.ndarray = None, label_length: int = None):
+        '''
+        Input: array of nodes (encoded (k-1)-mers or strings), start and end node id of
+        every edge, optionally the multiplicity of every edge and the length of the
+        (k-1)-mers if the nodes are encoded.
+        '''
+        self.node_values = np.asarray(nodes)
+        self.label_length = label_length
+        self._labels = None
+        self._index = None
+        if multiplicity is None:
+            multiplicity = np.ones(len(sources), dtype=np.int64)
+        self._set_edges(np.asarray(sources, dtype=np.int64), np.asarray(targets, dtype=np.int64),
+                        np.asarray(multiplicity, dtype=np.int64))
+
+    def _set_edges(self, sources: np.ndarray, targets: np.ndarray, multiplicity: np.ndarray) -> None:
+        '''Sort the edges, merge equal edges and build the CSR arrays and degrees.'''
+        n_nodes = len(self.node_values)
+        self._degree_summary = None
+        self.sources, self.targets, self.multiplicity, self.offsets = _csr_edges(
+            n_nodes, sources, targets, multiplicity)
+        self.out_degrees = np.bincount(self.sources, weights=self.multiplicity,
+                                       minlength=n_nodes).astype(np.int64)
+        self.in_degrees = np.bincount(self.targets, weights=self.multiplicity,
+                                      minlength=n_nodes).astype(np.int64)
+
+    @classmethod
+    def from_edges(cls, lefts: np.ndarray, rights: np.ndarray, label_length: int = None,
+                   multiplicity: np.ndarray = None):
+        '''
+        Input: start and end node of every edge (encoded (k-1)-mers or strings), the
+        length of the (k-1)-mers if they are encoded and optionally the multiplicity
+        of every edge.
+
+        Returns the DeBruijnGraph with these edges.
+        '''
+        import pandas as pd
+        # L and R of every k-mer in order, so nodes are numbered by first appearance
+        ends = np.empty(2 * len(lefts), dtype=np.asarray(lefts).dtype)
+        ends[0::2] = lefts
+        ends[1::2] = rights
+        node_ids, nodes = pd.factorize(ends)
+        return cls(nodes, node_ids[0::2], node_ids[1::2], multiplicity, label_length)
+
+    @classmethod
+    def from_k_mer_counts(cls, k_mers: np.ndarray, counts: np.ndarray, k: int):
+        '''
+        Input: distinct k-mers (encoded, or strings if k is larger than 32) in order of
+        first appearance, how often every k-mer occurs and length of the k-mers.
+
+        Returns the DeBruijnGraph with one edge per k-mer occurrence.
+        '''
+        if k > _MAX_ENCODED_K:
+            return cls.from_edges(np.array([k_mer[:-1] for k_mer in k_mers], dtype=object),
+                                  np.array([k_mer[1:] for k_mer in k_mers], dtype=object),
+                                  multiplicity=counts)
+        return cls.from_edges(k_mers >> np.uint64(2),
+                              k_mers & np.uint64((1 << (2 * (k - 1))) - 1), k - 1, counts)
+
+    @classmethod
+    def from_segments(cls, segments: Iterable, k: int, min_abundance: int = 1):
+        '''
+        Input: DNA strings or PackedSequences of the segments, length of the k-mers and
+        the number of times a k-mer has to occur to be used.
+
+        Returns the DeBruijnGraph of the k-mers of all segments.
+        '''
+        return cls.from_k_mer_counts(
+            *_filter_k_mer_counts(*_count_k_mers(segments, k), min_abundance), k)
+
+    @property
+    def labels(self) -> list:
+        '''Names of the nodes ((k-1)-mers), indexed by node id.'''
+        if self._labels is None:
+            if self.label_length is None:
+                self._labels = list(self.node_values)
+            else:
+                self._labels = _decode_k_mers(self.node_values, self.label_length)
+        return self._labels
+
+    @property
+    def index(self) -> dict:
+        '''Node id of every node name.'''
+        if self._index is None:
+            self._index = {label: node_id for node_id, label in enumerate(self.labels)}
+        return self._index
+
+    def number_of_nodes(self) -> int:
+        return len(self.node_values)
+
+    def number_of_edges(self) -> int:
+        return int(self.multiplicity.sum())
+
+    def nodes(self) -> list:
+        return self.labels
+
+    def edges(self) -> list:
+        '''Returns list of (start, end) node names, parallel edges repeated.'''
+        labels = self.labels
+        return [(labels[source], labels[target])
+                for source, target in zip(np.repeat(self.sources, self.multiplicity),
+                                          np.repeat(self.targets, self.multiplicity))]
+
+    def label(self, node_id: int) -> str:
+        '''Returns the name of a single node, without decoding all others.'''
+        if self._labels is not None or self.label_length is None:
+            return self.labels[node_id]
+        return _decode_k_mers(self.node_values[node_id:node_id + 1], self.label_length)[0]
+
+    def last_letters(self, node_ids: list) -> str:
+        '''
+        Input: list of node ids.
+
+        Returns string with the last letter of each of these nodes.
+        '''
+        if self.label_length is None:
+            labels = self.labels
+            return ''.join([labels[node_id][-1] for node_id in node_ids])
+        if self.label_length == 0:
+            return ''
+        codes = self.node_values[np.asarray(node_ids, dtype=np.int64)] & np.uint64(3)
+        return np.frombuffer(_NUCLEOTIDES.encode(), dtype=np.uint8)[codes].tobytes().decode()
+
+    def add_edge(self, source: str, target: str) -> None:
+        '''
+        Add an edge between two existing nodes.
+
+        Input: name of the start and end node.
+        '''
+        self.add_edge_ids(self.index[source], self.index[target])
+
+    def add_edge_ids(self, source: int, target: int) -> None:
+        '''
+        Add an edge between two existing nodes.
+
+        Input: id of the start and end node.
+        '''
+        self._set_edges(np.append(self.sources, source), np.append(self.targets, target),
+                        np.append(self.multiplicity, 1))
+
+    def to_networkx(self, max_nodes: int = None) -> nx.MultiDiGraph:
+        '''
+        Input: optionally the number of nodes to keep, to only convert the part of the
+        graph between the first max_nodes nodes (e.g. for plotting).
+
+        Returns the same graph as networkx MultiDiGraph.
+        '''
+        import networkx as nx
+        graph = nx.MultiDiGraph()
+        if max_nodes is None or max_nodes >= len(self.node_values):
+            graph.add_nodes_from(self.labels)
+            graph.add_edges_from(self.edges())
+            return graph
+        labels = self.labels[:max_nodes]
+        graph.add_nodes_from(labels)
+        keep = (self.sources < max_nodes) & (self.targets < max_nodes)
+        sources = np.repeat(self.sources[keep], self.multiplicity[keep])
+        targets = np.repeat(self.targets[keep], self.multiplicity[keep])
+        graph.add_edges_from(zip([labels[node_id] for node_id in sources],
+                                 [labels[node_id] for node_id in targets]))
+        return graph
+
+
+def _csr_edges(n_nodes: int, sources: np.ndarray, targets: np.ndarray, multiplicity: np.ndarray):
+    '''
+    Sort edges on start and end node and merge parallel edges.
+
+    Input: number of nodes, start and end node id and multiplicity of every edge.
+
+    Returns start node, end node and multiplicity of every distinct edge and the offsets
+    such that the edges of node i are at offsets[i]:offsets[i + 1].
+    '''
+    order = np.lexsort((targets, sources))
+    sources, targets, multiplicity = sources[order], targets[order], multiplicity[order]
+    # merge parallel edges into one edge with a multiplicity
+    is_first = np.ones(len(sources), dtype=bool)
+    is_first[1:] = (sources[1:] != sources[:-1]) | (targets[1:] != targets[:-1])
+    starts = np.flatnonzero(is_first)
+    if len(starts):
+        multiplicity = np.add.reduceat(multiplicity, starts)
+    offsets = np.zeros(n_nodes + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum(np.bincount(sources[starts], minlength=n_nodes))
+    return sources[starts], targets[starts], multiplicity, offsets
+
+
+# Compacted de Bruijn graph
+
+class UnitigGraph:
+    '''
+    De Bruijn graph in which every non-branching path is collapsed into a single edge.
+
+    Only nodes with an in or out degree other than 1 are kept (and the first node, where
+    the walk starts). A path through nodes with one edge in and one edge out becomes
+    one edge, a unitig, that spells the last letters of the nodes it passes and ends in.
+    The edges leaving a node are sorted on the first node they pass, like the edges of
+    the full graph, so walks over both graphs give the same sequence. Parallel edges
+    between kept nodes keep their multiplicity.
+    '''
+
+    def __init__(self, graph: DeBruijnGraph, node_ids: np.ndarray, sources: np.ndarray,
+                 targets: np.ndarray, first_hops: np.ndarray, multiplicity: np.ndarray,
+                 path_offsets: np.ndarray, path_nodes: np.ndarray):
+        '''
+        Input: the full DeBruijnGraph, ids (in the full graph) of the kept nodes, start
+        and end node (index in node_ids) of every unitig, id of the first node it passes,
+        its multiplicity and the ids of the nodes it passes: path_nodes[path_offsets[i]:
+        path_offsets[i + 1]] for unitig i.
+        '''
+        self.graph = graph
+        self.node_ids = np.asarray(node_ids, dtype=np.int64)
+        self._set_edges(sources, targets, first_hops, multiplicity, path_offsets, path_nodes)
+
+    def _set_edges(self, sources, targets, first_hops, multiplicity, path_offsets,
+                   path_nodes) -> None:
+        '''Sort the unitigs on start node and first node and build the CSR arrays and degrees.'''
+        n_nodes = len(self.node_ids)
+        self._degree_summary = None
+        order = np.lexsort((first_hops, sources))
+        self.sources = np.asarray(sources, dtype=np.int64)[order]
+        self.targets = np.asarray(targets, dtype=np.int64)[order]
+        self.first_hops = np.asarray(first_hops, dtype=np.int64)[order]
+        self.multiplicity = np.asarray(multiplicity, dtype=np.int64)[order]
+        self.path_offsets, self.path_nodes = _gather_paths(path_offsets, path_nodes, order)
+        self.offsets = np.zeros(n_nodes + 1, dtype=np.int64)
+        self.offsets[1:] = np.cumsum(np.bincount(self.sources, minlength=n_nodes))
+        self.out_degrees = np.bincount(self.sources, weights=self.multiplicity,
+                                       minlength=n_nodes).astype(np.int64)
+        self.in_degrees = np.bincount(self.targets, weights=self.multiplicity,
+                                      minlength=n_nodes).astype(np.int64)
+
+    def number_of_nodes(self) -> int:
+        return len(self.node_ids)
+
+    def number_of_edges(self) -> int:
+        return int(self.multiplicity.sum())
+
+    def nodes(self) -> list:
+        # only the kept nodes are decoded
+        if self.graph._labels is not None or self.graph.label_length is None:
+            labels = self.graph.labels
+            return [labels[node_id] for node_id in self.node_ids]
+        return _decode_k_mers(self.graph.node_values[self.node_ids], self.graph.label_length)
+
+    def label(self, node_id: int) -> str:
+        '''Returns the name of a kept node.'''
+        return self.graph.label(self.node_ids[node_id])
+
+    def spelling(self, edges: list) -> str:
+        '''
+        Input: list of unitig ids.
+
+        Returns string with the letters the unitigs add to the sequence, one after the other.
+        '''
+        offsets, path_nodes = _gather_paths(self.path_offsets, self.path_nodes, edges)
+        return self.graph.last_letters(path_nodes)
+
+    def add_edge_ids(self, source: int, target: int) -> None:
+        '''
+        Add an edge between two kept nodes.
+
+        Input: index of the start and end node in node_ids.
+        '''
+        target_id = self.node_ids[target]
+        # an edge between the same kept nodes without nodes in between is a parallel edge
+        existing = np.flatnonzero((self.sources == source) & (self.first_hops == target_id))
+        if len(existing):
+            multiplicity = self.multiplicity.copy()
+            multiplicity[existing[0]] += 1
+            self._set_edges(self.sources, self.targets, self.first_hops, multiplicity,
+                            self.path_offsets, self.path_nodes)
+            return
+        self._set_edges(np.append(self.sources, source), np.append(self.targets, target),
+                        np.append(self.first_hops, target_id), np.append(self.multiplicity, 1),
+                        np.append(self.path_offsets, len(self.path_nodes) + 1),
+                        np.append(self.path_nodes, target_id))
+
+    def to_networkx(self, max_nodes: int = None) -> nx.MultiDiGraph:
+        '''
+        Input: optionally the number of nodes to keep, to only convert the part of the
+        graph between the first max_nodes nodes (e.g. for plotting).
+
+        Returns the compacted graph as networkx MultiDiGraph, with the letters every
+        unitig adds as edge attribute sequence.
+        '''
+        import networkx as nx
+        graph = nx.MultiDiGraph()
+        labels = self.nodes()[:max_nodes]
+        graph.add_nodes_from(labels)
+        for edge, (source, target) in enumerate(zip(self.sources, self.targets)):
+            if source >= len(labels) or target >= len(labels):
+                continue
+            sequence = self.spelling([edge])
+            for _ in range(self.multiplicity[edge]):
+                graph.add_edge(labels[source], labels[target], sequence=sequence)
+        return graph
+
+
+def _gather_paths(path_offsets: np.ndarray, path_nodes: np.ndarray, edges: list):
+    '''
+    Select the paths of some unitigs.
+
+    Input: offsets and nodes of the paths of all unitigs and the unitig ids to select.
+
+    Returns offsets and nodes of the selected paths, in the given order.
+    '''
+    edges = np.asarray(edges, dtype=np.int64)
+    starts = path_offsets[edges]
+    lengths = path_offsets[edges + 1] - starts
+    offsets = np.zeros(len(edges) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum(lengths)
+    # position of every selected node in path_nodes
+    positions = np.repeat(starts - offsets[:-1], lengths) + np.arange(offsets[-1])
+    return offsets, np.asarray(path_nodes, dtype=np.int64)[positions]
+
+
+def compact_graph(graph) -> UnitigGraph:
+    '''
+    Collapse the non-branching paths of a de Bruijn graph into unitigs.
+
+    Input: DeBruijnGraph or networkx de Bruijn graph.
+
+    Returns the UnitigGraph. It has the same validity and DNA sequence as the full
+    graph, with one node per branching point instead of one per (k-1)-mer.
+    '''
+    if not isinstance(graph, DeBruijnGraph):
+        node_index, sources, targets = _edge_arrays(graph)
+        graph = DeBruijnGraph(np.array(list(node_index), dtype=object), sources, targets)
+    n_nodes = graph.number_of_nodes()
+    nodes = np.arange(n_nodes)
+    # nodes with exactly one edge in and one edge out are passed through
+    internal = (graph.in_degrees == 1) & (graph.out_degrees == 1)
+    internal[:1] = False
+    successor = np.full(n_nodes, -1, dtype=np.int64)
+    successor[internal] = graph.targets[graph.offsets[:-1][internal]]
+    predecessor = np.full(n_nodes, -1, dtype=np.int64)
+    into_internal = internal[graph.targets]
+    predecessor[graph.targets[into_internal]] = graph.sources[into_internal]
+    while True:
+        # pointer jumping: the first internal node of every path and the depth in it
+        chained = internal.copy()
+        chained[internal] = internal[predecessor[internal]]
+        head = np.where(chained, predecessor, nodes)
+        depth = chained.astype(np.int64)
+        for _ in range(max(n_nodes, 1).bit_length() + 1):
+            depth = depth + depth[head]
+            head = head[head]
+        # internal nodes on a cycle without kept nodes have no first node, keep them
+        on_cycle = internal & chained[head]
+        if not on_cycle.any():
+            break
+        internal &= ~on_cycle
+        successor[on_cycle] = -1
+
+    kept = np.flatnonzero(~internal)
+    compact_id = np.full(n_nodes, -1, dtype=np.int64)
+    compact_id[kept] = np.arange(len(kept))
+    # edges between kept nodes stay as they are
+    direct = ~internal[graph.sources] & ~internal[graph.targets]
+    direct_targets = graph.targets[direct]
+    # every other unitig starts with a first internal node and passes the nodes with
+    # that first node in order of depth, then ends in the successor of the last one
+    path = np.flatnonzero(internal)
+    path = path[np.lexsort((depth[path], head[path]))]
+    first_hops, starts, lengths = np.unique(head[path], return_index=True, return_counts=True)
+    ends = successor[path[starts + lengths - 1]]
+    path_nodes = np.insert(path, starts + lengths, ends)
+    path_offsets = np.concatenate(([0], np.cumsum(np.ones(len(direct_targets), dtype=np.int64)),
+                                   len(direct_targets) + np.cumsum(lengths + 1)))
+    return UnitigGraph(
+        graph, kept,
+        compact_id[np.concatenate((graph.sources[direct], predecessor[first_hops]))],
+        compact_id[np.concatenate((direct_targets, ends))],
+        np.concatenate((direct_targets, first_hops)),
+        np.concatenate((graph.multiplicity[direct], np.ones(len(first_hops), dtype=np.int64))),
+        path_offsets, np.concatenate((direct_targets, path_nodes)))
+
+
+# Stream the csv file through a memory map, segment by segment
+
+def iter_segment_blocks(name: str, block_size: int = 2 ** 24) -> Iterator[pd.DataFrame]:
+    '''
+    Read the csv file through a memory map, in blocks that only hold whole segments.
+
+    Input: name of the csv file and the number of bytes per block.
+
+    Yields a DataFrame (same columns and dtypes as read_csv) with the rows of one or more
+    complete segments, in file order.
+
+    The file is never read into memory as a whole: the mapped bytes are parsed in small
+    pieces straight into the dtypes of read_csv and appended to columns that grow in
+    place. Once a block worth of bytes is parsed the columns are cut at the last segment
+    boundary, the rows of the segment that continues are kept for the next block. So the
+    rows are held about once, also when a single segment spans many blocks, and the
+    pages of the map that are parsed are given back. The rows of a segment have to be
+    stored next to each other in the file.
+    '''
+    import mmap
+    import pandas as pd
+    with open(name, 'rb') as csv_file:
+        size = os.fstat(csv_file.fileno()).st_size
+        if size == 0:
+            return
+        # the map is closed when no array uses it anymore
+        buffer = mmap.mmap(csv_file.fileno(), 0, access=mmap.ACCESS_READ)
+    data = np.frombuffer(buffer, dtype=np.uint8)
+    finished_segments = set()
+    # parsed rows that are not yielded yet and the row where the last segment in them begins
+    columns = {column: np.zeros(0, dtype=dtype) for column, dtype in _CSV_DTYPES.items()}
+    boundary = None
+    parsed_bytes = 0
+    start = 0
+    while start < size:
+        # pieces end at the end of a line
+        end = buffer.find(b'\n', min(start + max(min(block_size, _PIECE_SIZE), 1), size) - 1)
+        end = size if end == -1 else end + 1
+        piece = _parse_rows(data[start:end], name)
+        _release_pages(buffer, start, end)
+        parsed_bytes += end - start
+        start = end
+        n_rows = len(columns['SegmentNr'])
+        segment_nrs = piece['SegmentNr']
+        if len(segment_nrs):
+            begins = np.flatnonzero(segment_nrs[1:] != segment_nrs[:-1]) + 1
+            if len(begins):
+                boundary = n_rows + begins[-1]
+            elif n_rows and segment_nrs[0] != columns['SegmentNr'][-1]:
+                boundary = n_rows
+            # grow the columns in place, no other array refers to them
+            for column, values in piece.items():
+                columns[column].resize(n_rows + len(values), refcheck=False)
+                columns[column][n_rows:] = values
+        if start < size and (parsed_bytes < block_size or boundary is None):
+            continue
+        # the last segment can continue in the next block
+        cut = boundary if start < size else len(columns['SegmentNr'])
+        rows = columns
+        columns = {column: values[cut:].copy() for column, values in rows.items()}
+        for values in rows.values():
+            values.resize(cut, refcheck=False)
+        boundary = None
+        parsed_bytes = 0
+        if cut:
+            _check_contiguous(rows['SegmentNr'], finished_segments, name)
+            yield pd.DataFrame(rows, copy=False)
+
+
+# bytes parsed at a time: every byte takes a few dozen bytes of temporary arrays while
+# it is parsed, small pieces keep those small (and in the processor cache)
+_PIECE_SIZE = 2 ** 18
+
+def _release_pages(buffer, start: int, end: int) -> None:
+    '''Tell the system that the mapped pages between start and end are not needed anymore.'''
+    import mmap
+    if hasattr(mmap, 'MADV_DONTNEED'):
+        start = -(-start // mmap.PAGESIZE) * mmap.PAGESIZE
+        end = end // mmap.PAGESIZE * mmap.PAGESIZE
+        if end > start:
+            buffer.madvise(mmap.MADV_DONTNEED, start, end - start)
+
+
+# bytes that can occur in the csv file: digits, minus signs, separators and line ends
+_ALLOWED_BYTES = np.zeros(256, dtype=bool)
+_ALLOWED_BYTES[np.frombuffer(b'0123456789-, \t\r\n', dtype=np.uint8)] = True
+
+
+def _parse_rows(data: np.ndarray, name: str) -> np.ndarray:
+    '''
+    Parse lines of comma separated integers without converting them to strings.
+
+    Input: bytes of whole lines as uint8 array and the name of the file (for errors).
+
+    Returns dictionary with the values of every column (SegmentNr, Position, A, C, G, T)
+    in the dtypes of read_csv, one value per line; empty lines are skipped.
+    '''
+    if not _ALLOWED_BYTES[data].all():
+        raise ValueError(f'{name} contains values that are not integers')
+    is_digit = (data >= ord('0')) & (data <= ord('9'))
+    # begin and end of every number
+    edges = np.diff(is_digit.view(np.int8), prepend=np.int8(0), append=np.int8(0))
+    starts = np.flatnonzero(edges == 1)
+    lengths = np.flatnonzero(edges == -1) - starts
+    # add one digit of all numbers at a time, most numbers have a single digit
+    values = data[starts].astype(np.int64) - ord('0')
+    for offset in range(1, lengths.max(initial=0)):
+        longer = np.flatnonzero(lengths > offset)
+        values[longer] = values[longer] * 10 + (data[starts[longer] + offset] - ord('0'))
+    values[(starts > 0) & (data[starts - 1] == ord('-'))] *= -1
+    # every line with numbers should have one for every column
+    line_ends = np.flatnonzero(data == ord('\n'))
+    per_line = np.diff(np.searchsorted(starts, line_ends), prepend=0, append=len(starts))
+    if np.any((per_line != 0) & (per_line != len(_COLUMNS))):
+        raise ValueError(f'every line of {name} should have {len(_COLUMNS)} values')
+    values = values.reshape(-1, len(_COLUMNS))
+    return {column: values[:, index].astype(dtype)
+            for index, (column, dtype) in enumerate(_CSV_DTYPES.items())}
+
+
+def iter_segments(name: str, block_size: int = 2 ** 24) -> Iterator[pd.DataFrame]:
+    '''
+    Read the csv file in blocks and yield every segment as soon as all of its rows are read.
+
+    Input: name of the csv file and number of bytes to parse at a time.
+
+    Yields a DataFrame with the rows of a single segment (index starting at 0), in file order.
+    '''
+    for block in iter_segment_blocks(name, block_size):
+        segment_nrs = block['SegmentNr'].to_numpy()
+        bounds = np.concatenate(([0], np.flatnonzero(segment_nrs[1:] != segment_nrs[:-1]) + 1,
+                                 [len(block)]))
+        for start, end in zip(bounds[:-1], bounds[1:]):
+            yield block.iloc[start:end].reset_index(drop=True)
+
+
+def _check_contiguous(segment_nrs: np.ndarray, finished_segments: set, name: str) -> None:
+    '''
+    Raise a ValueError if the rows of a segment are not stored next to each other.
+
+    Input: segment number of every row of a block of whole segments, set of segment
+    numbers of the blocks before (updated) and name of the file.
+    '''
+    run_nrs = segment_nrs[np.concatenate(([True], segment_nrs[1:] != segment_nrs[:-1]))]
+    unique_nrs, counts = np.unique(run_nrs, return_counts=True)
+    repeated = unique_nrs[counts > 1].tolist() + sorted(
+        finished_segments.intersection(unique_nrs.tolist()))
+    if repeated:
+        raise ValueError(f'rows of segment {repeated[0]} are not stored next to each other '
+                         f'in {name}, it can not be streamed')
+    finished_segments.update(unique_nrs.tolist())
+
+
+def construct_graph_streaming(name: str, k: int, block_size: int = 2 ** 24, native: bool = False,
+                              min_abundance: int = 1, counters: dict = None):
+    '''
+    Construct the de Bruijn graph straight from the csv file, without loading the whole file.
+
+    Input: name of the csv file, length of the k-mers, number of bytes to read at a time,
+    whether to build a DeBruijnGraph instead of a networkx graph, the number of times
+    a k-mer has to occur to be used and optionally a dictionary that is filled with the
+    counters of the cleaning (as in the stages of assemble_file): rows, positions_dropped,
+    segments_with_errors, segments_removed and segments_kept.
+
+    Returns the same de Bruijn graph as read_csv, clean_data, generate_sequences and
+    construct_graph would give.
+
+    Whether a segment is a duplicate is only known once the whole file has been read,
+    so the file is read twice (through a memory map, see iter_segment_blocks): the first
+    pass cleans every block of segments and keeps a small fingerprint per segment, the
+    second pass counts the k-mers of the remaining segments block by block and folds the
+    counts into one table of distinct k-mers. Segments that share a fingerprint are
+    compared value by value at the end of the second pass, so a hash collision never
+    removes a segment; until then their values are kept, which only takes memory for
+    duplicated segments. The nodes are numbered as if the segments were read in order of
+    segment number, also when the file is not sorted on it. Besides one block, the memory
+    holds a fingerprint per segment and the table of distinct k-mers (which is as large
+    as the graph), also when k is larger than 32.
+    '''
+    # first pass: clean positions and group the segments on their fingerprint
+    counters = {} if counters is None else counters
+    counters.update(rows=0, positions_dropped=0, segments_with_errors=0)
+    valid_segments = set()
+    copies = {}
+    for block in iter_segment_blocks(name, block_size):
+        segment_nrs = set(np.unique(block['SegmentNr'].to_numpy()).tolist())
+        counters['rows'] += len(block)
+        counters['positions_dropped'] += len(block)
+        block, to_remove_segment = _clean_positions(block)
+        counters['positions_dropped'] -= len(block)
+        counters['segments_with_errors'] += len(to_remove_segment)
+        valid_segments.update(segment_nrs.difference(to_remove_segment))
+        for segment_nr, values in _split_segments(block):
+            copies.setdefault(_segment_fingerprint(values), []).append(segment_nr)
+    groups = [segment_nrs for segment_nrs in copies.values() if len(segment_nrs) > 1]
+    keep_segments = valid_segments.intersection(
+        segment_nrs[0] for segment_nrs in copies.values() if len(segment_nrs) == 1)
+    n_segments = sum(len(segment_nrs) for segment_nrs in copies.values())
+    del copies
+    candidates = {segment_nr for segment_nrs in groups for segment_nr in segment_nrs}
+
+    # second pass: count the k-mers of the segments that are kept
+    table = _count_block_k_mers({}, k)
+    block_tables = []
+    candidate_values = {}
+    for block in iter_segment_blocks(name, block_size):
+        block = block[block['SegmentNr'].isin(keep_segments) |
+                      block['SegmentNr'].isin(candidates)]
+        block, _ = _clean_positions(block)
+        # segments with the same fingerprint are compared value by value once all are read
+        is_candidate = block['SegmentNr'].isin(candidates).to_numpy()
+        candidate_values.update(_split_segments(block[is_candidate]))
+        block_tables += [_count_block_k_mers(pack_segments(block[~is_candidate]), k)]
+        # fold the blocks in once they have as many k-mers as the table, so every
+        # k-mer is merged a few times only
+        if sum(len(block_table[0]) for block_table in block_tables) >= len(table[0]):
+            table = _merge_ordered_k_mer_counts([table] + block_tables)
+            block_tables = []
+    # clean_data removes every copy of a segment but the last one
+    last_copies = valid_segments.intersection(
+        segment_nr for segment_nrs in groups for segment_nr in _last_copies(
+            [(segment_nr, candidate_values[segment_nr]) for segment_nr in segment_nrs]))
+    block_tables += [_count_block_k_mers(
+        {segment_nr: PackedSequence.from_one_hot(candidate_values[segment_nr])
+         for segment_nr in last_copies}, k)]
+    table = _merge_ordered_k_mer_counts([table] + block_tables)
+    counters['segments_kept'] = len(keep_segments) + len(last_copies)
+    counters['segments_removed'] = n_segments - counters['segments_kept']
+    graph = DeBruijnGraph.from_k_mer_counts(*_filter_k_mer_counts(*table[:2], min_abundance), k)
+    if native:
+        return graph
+    return graph.to_networkx()
+
+
+def _split_segments(block: pd.DataFrame) -> Iterator:
+    '''
+    Input: DataFrame with the rows of whole segments, each stored next to each other.
+
+    Yields the segment number and the A, C, G, T values of every segment, in order.
+    '''
+    segment_nrs = block['SegmentNr'].to_numpy()
+    values = block[['A', 'C', 'G', 'T']].to_numpy()
+    bounds = np.concatenate(([0], np.flatnonzero(segment_nrs[1:] != segment_nrs[:-1]) + 1,
+                             [len(block)]))
+    for start, end in zip(bounds[:-1], bounds[1:]):
+        if end > start:
+            yield segment_nrs[start].item(), values[start:end]
+
+
+def _count_block_k_mers(segments: dict, k: int):
+    '''
+    Count the k-mers of the segments of one block.
+
+    Input: dictionary with the PackedSequence of every segment number and length of the
+    k-mers.
+
+    Returns four arrays: the distinct k-mers (encoded, or strings if k is larger than 32),
+    how often every k-mer occurs and the segment number and index within the segment
+    where it first occurs.
+    '''
+    import pandas as pd
+    segment_nrs = sorted(segments)
+    k_mer_arrays = [np.zeros(0, dtype=object if k > _MAX_ENCODED_K else np.uint64)]
+    for segment_nr in segment_nrs:
+        dna_data = segments[segment_nr]
+        if k > _MAX_ENCODED_K:
+            k_mer_arrays += [np.array(_generate_k_mers(_get_dna_string(dna_data), k),
+                                      dtype=object)]
+        else:
+            k_mer_arrays += [_encode_k_mers(dna_data.codes(), k, dna_data.invalid())[0]]
+    k_mers = np.concatenate(k_mer_arrays)
+    k_mer_ids, distinct = pd.factorize(k_mers)
+    first = np.unique(k_mer_ids, return_index=True)[1]
+    lengths = np.array([len(k_mers) for k_mers in k_mer_arrays[1:]], dtype=np.int64)
+    segment_of = np.repeat(np.array(segment_nrs, dtype=np.int64), lengths)
+    segment_starts = np.repeat(np.cumsum(lengths) - lengths, lengths)
+    return (np.asarray(distinct, dtype=k_mers.dtype),
+            np.bincount(k_mer_ids, minlength=len(distinct)),
+            segment_of[first], first - segment_starts[first])
+
+
+def _merge_ordered_k_mer_counts(tables: list):
+    '''
+    Merge the k-mer counts of blocks that hold their segments in any order.
+
+    Input: list of tables from _count_block_k_mers (or from this function), every segment
+    in one table only.
+
+    Returns a table like _count_block_k_mers with the distinct k-mers of all tables in order
+    of first appearance (segments in order of segment number), their total counts and
+    where they first occur; the first two arrays are the same as _count_k_mers on the
+    sorted segments.
+    '''
+    import pandas as pd
+    k_mers, counts, segment_nrs, firsts = (
+        np.concatenate([table[column] for table in tables]) for column in range(4))
+    order = np.lexsort((firsts, segment_nrs))
+    k_mer_ids, distinct = pd.factorize(k_mers[order])
+    first = order[np.unique(k_mer_ids, return_index=True)[1]]
+    total = np.zeros(len(distinct), dtype=np.int64)
+    np.add.at(total, k_mer_ids, counts[order])
+    return np.asarray(distinct, dtype=k_mers.dtype), total, segment_nrs[first], firsts[first]
+
+
+# Build the de Bruijn graph of segments that arrive in batches
+
+class IncrementalAssembler:
+    '''
+    De Bruijn graph of segments that are read in batches, updated with every batch.
+
+    Every batch is cleaned like clean_data: segments with errors in their positions are
+    not used, and of segments with equal values only the last copy is kept, so a copy in
+    a later batch retracts the copy added before. Copies are found on their fingerprint
+    and compared with the packed sequence of the kept copy before it is retracted, so a
+    hash collision never retracts a segment. Every kept segment is encoded once,
+    into a table of its distinct k-mers. The net change in k-mer counts of a batch
+    updates the count and first appearance of every k-mer it touches, the in minus out
+    degree of the nodes, the number of unbalanced nodes and a union-find of the nodes,
+    so the degree and connectivity conditions of is_valid_graph are known without
+    looking at earlier batches, and graph() is built from the counts, without encoding
+    any segment again.
+
+    Two updates look at more than the new batch, both only after a retraction: k-mers
+    that first appeared in a retracted segment are looked up in the tables of the other
+    segments, and if edges disappear (a retracted copy that is not replaced) the
+    union-find is rebuilt from the remaining k-mers by the next is_valid().
+
+    A segment has to be in a single batch, a segment number can not come back later.
+    '''
+
+    def __init__(self, k: int):
+        '''
+        Input: length of the k-mers.
+        '''
+        self.k = k
+        # distinct k-mers, their counts and first index of every kept segment, and
+        # every segment number seen so far
+        self._tables = {}
+        self._seen_segments = set()
+        # kept segments per fingerprint, with their packed sequence (and their values
+        # if these are not only zeros and ones) to compare later copies with
+        self._copies = {}
+        self._packed = {}
+        self._raw_values = {}
+        # count and (segment number, index) of the first appearance of every k-mer
+        self._k_mer_counts = {}
+        self._first_seen = {}
+        # out minus in degree and total degree of every node with edges
+        self._balance = {}
+        self._degree = {}
+        # number of nodes with out minus in degree 1, -1 and anything else but 0
+        self._n_first = 0
+        self._n_last = 0
+        self._n_other = 0
+        self._parent = {}
+        self._components = 0
+        self._rebuild_components = False
+
+    def add_segments(self, df: pd.DataFrame) -> dict:
+        '''
+        Clean a batch of rows and add its segments to the graph.
+
+        Input: DataFrame with columns SegmentNr, Position, A, C, G, T, as read_csv gives.
+
+        Returns dictionary with the number of segments in the batch, the number that is
+        kept and the number of kept segments of earlier batches that are retracted.
+        '''
+        import pandas as pd
+        if df.empty:
+            return {'segments': 0, 'kept': 0, 'retracted': 0}
+        segment_nrs = pd.unique(df['SegmentNr']).tolist()
+        seen_before = self._seen_segments.intersection(segment_nrs)
+        if seen_before:
+            raise ValueError(f'segment {min(seen_before)} is in an earlier batch')
+        self._seen_segments.update(segment_nrs)
+
+        df, to_remove_segment = _clean_positions(df)
+        wrong_segments = set(to_remove_segment)
+        added = {}
+        retracted = []
+        # segments in order of first appearance, like _clean_segments
+        segment_codes, segments = pd.factorize(df['SegmentNr'])
+        order = np.argsort(segment_codes, kind='stable')
+        values = df[['A', 'C', 'G', 'T']].to_numpy()[order]
+        ends = np.cumsum(np.bincount(segment_codes))
+        starts = ends - np.bincount(segment_codes)
+        for segment_nr, start, end in zip(segments.tolist(), starts, ends):
+            segment_values = values[start:end]
+            copies = self._copies.setdefault(_segment_fingerprint(segment_values), [])
+            # a kept copy with the same fingerprint is only retracted if it is really equal
+            for earlier_copy in [earlier_copy for earlier_copy in copies
+                                 if self._equals_copy(earlier_copy, segment_values)]:
+                copies.remove(earlier_copy)
+                del self._packed[earlier_copy]
+                self._raw_values.pop(earlier_copy, None)
+                if earlier_copy in added:
+                    del added[earlier_copy]
+                else:
+                    retracted += [earlier_copy]
+            if segment_nr not in wrong_segments:
+                copies += [segment_nr]
+                self._packed[segment_nr] = PackedSequence.from_one_hot(segment_values)
+                if not np.isin(segment_values, [0, 1]).all():
+                    self._raw_values[segment_nr] = segment_values.copy()
+                added[segment_nr] = None
+        added = {segment_nr: self._segment_table(self._packed[segment_nr])
+                 for segment_nr in added}
+        retracted = {segment_nr: self._tables.pop(segment_nr) for segment_nr in retracted}
+        self._tables.update(added)
+
+        self._update_counts(list(added.values()), list(retracted.values()))
+        self._update_first_seen(added, retracted)
+        return {'segments': len(segment_nrs), 'kept': len(added), 'retracted': len(retracted)}
+
+    def _equals_copy(self, segment_nr, values: np.ndarray) -> bool:
+        '''
+        Input: number of a kept segment and the A, C, G, T values of another segment.
+
+        Returns whether the values are equal to those of the kept segment.
+        '''
+        if segment_nr in self._raw_values:
+            return np.array_equal(self._raw_values[segment_nr], values)
+        codes = self._packed[segment_nr].codes()
+        # the values of a kept segment without other values are one 1 per row
+        return len(codes) == len(values) and np.array_equal(
+            np.eye(4, dtype=np.int8)[codes], values)
+
+    def _segment_table(self, dna_data: PackedSequence) -> tuple:
+        '''
+        Input: PackedSequence of one segment.
+
+        Returns its distinct k-mers (encoded, or strings if k is larger than 32) in order
+        of first appearance, how often each occurs and the index where it first occurs.
+        '''
+        import pandas as pd
+        if self.k > _MAX_ENCODED_K:
+            k_mers = np.array(_generate_k_mers(_get_dna_string(dna_data), self.k), dtype=object)
+        else:
+            k_mers = _encode_k_mers(dna_data.codes(), self.k, dna_data.invalid())[0]
+        k_mer_ids, distinct = pd.factorize(k_mers)
+        return (np.asarray(distinct, dtype=k_mers.dtype),
+                np.bincount(k_mer_ids, minlength=len(distinct)),
+                np.unique(k_mer_ids, return_index=True)[1])
+
+    def _update_counts(self, added: list, retracted: list) -> None:
+        '''Apply the net change in k-mer counts of the tables of added and retracted segments.'''
+        import pandas as pd
+        if not added and not retracted:
+            return
+        tables = added + retracted
+        k_mer_ids, distinct = pd.factorize(np.concatenate([table[0] for table in tables]))
+        weights = np.concatenate([table[1] if index < len(added) else -table[1]
+                                  for index, table in enumerate(tables)])
+        delta = np.bincount(k_mer_ids, weights=weights,
+                            minlength=len(distinct)).astype(np.int64)
+        changed = np.flatnonzero(delta)
+        distinct, delta = np.asarray(distinct)[changed], delta[changed]
+        lefts, rights = self._ends(distinct)
+
+        # new edges join components, edges that disappear can split them
+        new_edges = []
+        for k_mer, change, left, right in zip(distinct.tolist(), delta.tolist(),
+                                              lefts.tolist(), rights.tolist()):
+            count = self._k_mer_counts.get(k_mer, 0) + change
+            if count == 0:
+                del self._k_mer_counts[k_mer]
+                self._rebuild_components = True
+            else:
+                if count == change:
+                    new_edges += [(left, right)]
+                self._k_mer_counts[k_mer] = count
+        for left, right in new_edges:
+            self._union(left, right)
+
+        # change of out minus in degree and of total degree of every node
+        node_ids, nodes = pd.factorize(np.concatenate((lefts, rights)))
+        balance = np.bincount(node_ids, weights=np.concatenate((delta, -delta)),
+                              minlength=len(nodes)).astype(np.int64)
+        degree = np.bincount(node_ids, weights=np.concatenate((delta, delta)),
+                             minlength=len(nodes)).astype(np.int64)
+        for node, node_balance, node_degree in zip(np.asarray(nodes).tolist(), balance.tolist(),
+                                                   degree.tolist()):
+            # unbalanced nodes are counted again once their degrees are updated
+            self._count_balance(node, -1)
+            node_degree += self._degree.get(node, 0)
+            if node_degree == 0:
+                del self._degree[node], self._balance[node]
+            else:
+                self._degree[node] = node_degree
+                self._balance[node] = self._balance.get(node, 0) + node_balance
+                self._count_balance(node, 1)
+
+    def _update_first_seen(self, added: dict, retracted: dict) -> None:
+        '''
+        Update the first appearance of the k-mers of added and retracted segments.
+
+        Input: tables of the added and of the retracted segments, by segment number.
+        '''
+        # k-mers that first appeared in a retracted segment, and are still there
+        lost = set()
+        for table in retracted.values():
+            for k_mer in table[0].tolist():
+                first_seen = self._first_seen.get(k_mer)
+                if first_seen is not None and first_seen[0] in retracted:
+                    del self._first_seen[k_mer]
+                    if k_mer in self._k_mer_counts:
+                        lost.add(k_mer)
+        # segments are added in any order, the lowest segment number comes first
+        for segment_nr, table in added.items():
+            for k_mer, index in zip(table[0].tolist(), table[2].tolist()):
+                first_seen = self._first_seen.get(k_mer)
+                if first_seen is None or (segment_nr, index) < first_seen:
+                    self._first_seen[k_mer] = (segment_nr, index)
+        if not lost:
+            return
+        # the first segment (in order of number) that still has a lost k-mer
+        lost_k_mers = np.array(list(lost), dtype=object if self.k > _MAX_ENCODED_K else np.uint64)
+        for segment_nr in sorted(self._tables):
+            k_mers, _, firsts = self._tables[segment_nr]
+            found = np.isin(k_mers, lost_k_mers)
+            for k_mer, index in zip(k_mers[found].tolist(), firsts[found].tolist()):
+                if k_mer in lost:
+                    self._first_seen[k_mer] = (segment_nr, index)
+                    lost.discard(k_mer)
+            if not lost:
+                return
+            lost_k_mers = lost_k_mers[np.isin(lost_k_mers, k_mers[found], invert=True)]
+
+    def _ends(self, k_mers: np.ndarray) -> tuple:
+        '''Start and end node of the edges of an array of k-mers.'''
+        if self.k > _MAX_ENCODED_K:
+            return (np.array([k_mer[:-1] for k_mer in k_mers], dtype=object),
+                    np.array([k_mer[1:] for k_mer in k_mers], dtype=object))
+        return k_mers >> np.uint64(2), k_mers & np.uint64((1 << (2 * (self.k - 1))) - 1)
+
+    def _count_balance(self, node, sign: int) -> None:
+        '''Add (sign 1) or remove (sign -1) a node from the counts of unbalanced nodes.'''
+        balance = self._balance.get(node, 0)
+        if balance == 1:
+            self._n_first += sign
+        elif balance == -1:
+            self._n_last += sign
+        elif balance != 0:
+            self._n_other += sign
+
+    def _find(self, node):
+        '''Root of the component of a node, adding the node if it is new.'''
+        if node not in self._parent:
+            self._parent[node] = node
+            self._components += 1
+            return node
+        root = node
+        while self._parent[root] != root:
+            root = self._parent[root]
+        # point the path straight to the root
+        while self._parent[node] != root:
+            self._parent[node], node = root, self._parent[node]
+        return root
+
+    def _union(self, left, right) -> None:
+        left_root, right_root = self._find(left), self._find(right)
+        if left_root != right_root:
+            self._parent[left_root] = right_root
+            self._components -= 1
+
+    def is_valid(self) -> bool:
+        '''
+        Returns the same as is_valid_graph on the graph of all batches so far.
+
+        The degree condition is checked first, the components are only counted again
+        (from the k-mers that are left) if edges have disappeared since the last check.
+        '''
+        unbalanced = self._n_first + self._n_last + self._n_other
+        if unbalanced != 0 and (unbalanced, self._n_first, self._n_last) != (2, 1, 1):
+            return False
+        if self._rebuild_components:
+            self._parent = {}
+            self._components = 0
+            k_mers = np.array(list(self._k_mer_counts),
+                              dtype=object if self.k > _MAX_ENCODED_K else np.uint64)
+            for left, right in zip(*(ends.tolist() for ends in self._ends(k_mers))):
+                self._union(left, right)
+            self._rebuild_components = False
+        return self._components <= 1
+
+    def graph(self) -> DeBruijnGraph:
+        '''
+        Returns the DeBruijnGraph of the kept segments, the same as construct_graph
+        (native) on clean_data of all batches together.
+
+        The graph is made from the k-mer counts, ordered on their first appearance; its
+        size depends on the number of distinct k-mers, not on the length of the segments.
+        '''
+        k_mers = list(self._k_mer_counts)
+        first_seen = np.array([self._first_seen[k_mer] for k_mer in k_mers],
+                              dtype=np.int64).reshape(-1, 2)
+        order = np.lexsort((first_seen[:, 1], first_seen[:, 0]))
+        k_mers = np.array(k_mers, dtype=object if self.k > _MAX_ENCODED_K else np.uint64)
+        counts = np.fromiter(self._k_mer_counts.values(), np.int64, len(k_mers))
+        return DeBruijnGraph.from_k_mer_counts(k_mers[order], counts[order], self.k)
+
+    def construct_dna_sequence(self):
+        '''
+        Returns the DNA sequence of the batches so far, or None if the graph is not valid.
+        '''
+        if not self.is_valid():
+            return None
+        return construct_dna_sequence(compact_graph(self.graph()))
+
+
 # Plot the de Bruijn graph
-def plot_graph(graph: nx.MultiDiGraph, filename: str) -> None:
+# plots of larger graphs are unreadable and the layout takes too long
+_PLOT_MAX_NODES = 500
+# node names are only drawn for small graphs
+_PLOT_MAX_LABELS = 50
+
+
+def plot_graph(graph: nx.MultiDiGraph, filename: str, max_nodes: int = _PLOT_MAX_NODES) -> bool:
     '''
     Plot the de Bruijn graph using NetworkX and save it to a file.
 
-    Input: de Bruijn graph to be plotted and output filename to save the plot.
+    Input: de Bruijn graph to be plotted, output filename to save the plot and the
+    largest number of nodes to draw (None to draw all nodes).
+
+    Returns True if the whole graph was plotted, False if only the first max_nodes
+    nodes (in order of appearance in the sequences) were plotted. Graphs with more
+    nodes are plotted compacted (see compact_graph) first.
     '''
-    pos = nx.planar_layout(graph)
+    # matplotlib is only needed here, so only load it when plotting
+    import matplotlib.pyplot as plt
+    import networkx as nx
+
+    title = ''
+    if max_nodes is not None and graph.number_of_nodes() > max_nodes and not isinstance(
+            graph, UnitigGraph):
+        graph = compact_graph(graph)
+        title = 'compacted'
+    n_nodes = graph.number_of_nodes()
+    complete = max_nodes is None or n_nodes <= max_nodes
+    if isinstance(graph, (DeBruijnGraph, UnitigGraph)):
+        graph = graph.to_networkx(None if complete else max_nodes)
+    elif not complete:
+        graph = graph.subgraph(list(graph.nodes())[:max_nodes])
+    if not complete:
+        title = f'{title}, first {max_nodes} of {n_nodes} nodes'.lstrip(', ')
+    # the planar layout fails on most de Bruijn graphs, use a spring layout for those
+    if nx.check_planarity(graph)[0]:
+        pos = nx.planar_layout(graph)
+    else:
+        pos = nx.spring_layout(graph, seed=0)
     # use matplotlib make to plot
     plt.figure()
-    nx.draw_networkx(graph, pos, with_labels=True)
+    if graph.number_of_nodes() <= _PLOT_MAX_LABELS:
+        nx.draw_networkx(graph, pos, with_labels=True)
+    else:
+        nx.draw_networkx(graph, pos, with_labels=False, node_size=20, arrowsize=5)
+    if title:
+        plt.title(title)
     # Save the plot to the output file
     plt.savefig(filename)
     plt.close()
+    return complete
 
 # Check whether the de Bruijn graph can be sequenced
 
@@ -256,49 +1767,119 @@ def is_valid_graph(graph: nx.MultiDiGraph) -> bool:
 
     Returns True if the graph is valid, False if not.
     '''
-    connectivity_check = True
-    # store whether or not a first or last node has been identified
-    first_node = False
-    last_node = False
-    # keep track of how many nodes with different degrees have been encountered
-    differ_degree = 0
-    for node in list(graph.nodes()):
-        # to pass for the connectivity test the result of the dfs should be equal
-        # to all the edges in the graph
-        if sorted(_dfs_recursive(graph, node, [])) != sorted(list(graph.nodes())):
-            connectivity_check = False
-        # check in and out degree of this node
-        if graph.in_degree(node) != graph.out_degree(node):
-            differ_degree += 1
-            if graph.in_degree(node) - graph.out_degree(node) == 1:
-                last_node = True
-            elif graph.out_degree(node) - graph.in_degree(node) == 1:
-                first_node = True
-    # second condition check: if nodes with different degrees are present one should be first and other one last
-    degree_check = (last_node and first_node and differ_degree ==
-                    2) or differ_degree == 0
-    # only returns true is both conditions are met
-    return connectivity_check and degree_check
-
-
-def _dfs_recursive(graph: nx.MultiDiGraph, starting_node: str, visited_list: list) -> list:
-    '''
-    Perform a depth-first search (DFS) traversal on a given graph starting from a specified node.
-
-    Input: Graph to perform DFS on, starting node for DFS traversal 
-    and List to store visited nodes during DFS traversal.
-
-    Returns list of visited nodes in the order they were visited.
-    '''
-    if visited_list is None:
-        visited_list = []
-    visited_list.append(starting_node)
-    # loop through all neigbours (both directions -> weakly connected)
-    for neigbour_node in set(list(graph.neighbors(starting_node)) + list(graph.predecessors(starting_node))):
-        if neigbour_node not in visited_list:
-            _dfs_recursive(graph, neigbour_node, visited_list)
-    # only reaches here when all possible nodes are traversed
-    return visited_list
+    # first condition check: if nodes with different degrees are present one should be
+    # first and other one last, otherwise the connectivity does not have to be checked
+    if not degree_summary(graph)['balanced']:
+        return False
+    if isinstance(graph, (DeBruijnGraph, UnitigGraph)):
+        return _is_weakly_connected(graph.number_of_nodes(), graph.sources, graph.targets)
+    # to pass for the connectivity test all nodes should be reachable from the first
+    # node when edges are followed in both directions (weakly connected)
+    node_index, sources, targets = _edge_arrays(graph)
+    return _is_weakly_connected(len(node_index), sources, targets)
+
+
+def degree_summary(graph) -> dict:
+    '''
+    Summarize the in and out degrees of all nodes of a de Bruijn graph in one pass.
+
+    Input: networkx graph, DeBruijnGraph or UnitigGraph.
+
+    Returns dictionary with the nodes whose in and out degree differ ('unbalanced'), the
+    last node with one more edge out than in ('begin') and in than out ('end'), or None,
+    and whether the degrees allow an Euler's path ('balanced': no unbalanced nodes, or
+    exactly one begin and one end node). Nodes are given by index in node order.
+
+    A DeBruijnGraph or UnitigGraph keeps its summary until its edges are set again. A
+    networkx graph can be changed in any way without notice, so its summary is made
+    again on every call.
+    '''
+    if isinstance(graph, (DeBruijnGraph, UnitigGraph)):
+        if graph._degree_summary is None:
+            graph._degree_summary = _summarize_degrees(graph.in_degrees, graph.out_degrees)
+        return graph._degree_summary
+    # the degree views list the nodes in node order
+    n_nodes = graph.number_of_nodes()
+    in_degrees = np.fromiter((degree for _, degree in graph.in_degree()), np.int64, n_nodes)
+    out_degrees = np.fromiter((degree for _, degree in graph.out_degree()), np.int64, n_nodes)
+    return _summarize_degrees(in_degrees, out_degrees)
+
+
+def _summarize_degrees(in_degrees: np.ndarray, out_degrees: np.ndarray) -> dict:
+    '''
+    Input: in and out degree of every node, in node order.
+
+    Returns the summary of degree_summary.
+    '''
+    difference = in_degrees - out_degrees
+    unbalanced = np.flatnonzero(difference)
+    begin = unbalanced[difference[unbalanced] == -1]
+    end = unbalanced[difference[unbalanced] == 1]
+    balanced = len(unbalanced) == 0 or (len(unbalanced) == 2 and len(begin) == len(end) == 1)
+    return {'unbalanced': unbalanced.tolist(),
+            'begin': begin[-1].item() if len(begin) else None,
+            'end': end[-1].item() if len(end) else None,
+            'balanced': balanced}
+
+
+def _node_index(graph: nx.MultiDiGraph) -> dict:
+    '''
+    Number the nodes of a networkx graph.
+
+    Input: networkx graph.
+
+    Returns dictionary with the index of every node, in node order. The index is made
+    again on every call, as the graph may have been edited since it was built; that
+    takes one pass over the nodes, little next to the pass over the edges.
+    '''
+    return {node: index for index, node in enumerate(graph.nodes())}
+
+
+def _edge_arrays(graph: nx.MultiDiGraph):
+    '''
+    List the edges of a networkx graph by node index.
+
+    Input: networkx graph.
+
+    Returns dictionary with the index of every node (in node order) and arrays with
+    the start and end index of every edge (parallel edges repeated).
+    '''
+    node_index = _node_index(graph)
+    edges = np.array([(node_index[start_node], node_index[end_node])
+                      for start_node, end_node in graph.edges()], dtype=np.int64).reshape(-1, 2)
+    return node_index, edges[:, 0], edges[:, 1]
+
+
+def _is_weakly_connected(n_nodes: int, sources: np.ndarray, targets: np.ndarray) -> bool:
+    '''
+    Check whether all nodes can be reached from the first one, ignoring edge directions.
+
+    Input: number of nodes and start and end node id of every edge.
+
+    Returns True if the graph is weakly connected (or empty), False if not.
+    '''
+    if n_nodes == 0:
+        return True
+    # neighbours in both directions, in compressed sparse row form
+    ends = np.concatenate((sources, targets))
+    neighbours = np.concatenate((targets, sources))[np.argsort(ends, kind='stable')]
+    offsets = np.zeros(n_nodes + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum(np.bincount(ends, minlength=n_nodes))
+    neighbours, offsets = neighbours.tolist(), offsets.tolist()
+
+    # breadth first search with a visited flag per node
+    visited = bytearray(n_nodes)
+    visited[0] = 1
+    n_visited = 1
+    queue = [0]
+    for node in queue:
+        for neighbour in neighbours[offsets[node]:offsets[node + 1]]:
+            if not visited[neighbour]:
+                visited[neighbour] = 1
+                n_visited += 1
+                queue.append(neighbour)
+    return n_visited == n_nodes
+
 
 # Construct DNA sequence
 
@@ -313,96 +1894,202 @@ def construct_dna_sequence(graph: nx.MultiDiGraph):
     '''
 
     # add extra edge if graph is not eulerian yet
-    _make_eulerian_graph(graph)
-    # apply hierhozer algorithm to get sequence
-    sequence_index_list = _hierholzer_algorithm(
-        _from_edges_to_matrix(graph), 0, [])
+    _make_eulerian_graph(graph, degree_summary(graph))
+    if isinstance(graph, DeBruijnGraph):
+        return _construct_native_dna_sequence(graph)
+    if isinstance(graph, UnitigGraph):
+        return _construct_unitig_dna_sequence(graph)
+    # number the nodes and put the edges in adjacency lists, sorted on end node
+    node_index, sources, targets = _edge_arrays(graph)
+    if len(sources) == 0:
+        return ''
+    _, targets, multiplicity, offsets = _csr_edges(
+        len(node_index), sources, targets, np.ones(len(sources), dtype=np.int64))
+    # apply hierhozer algorithm to get sequence, the last node closes the circuit
+    sequence_index_list = _eulerian_circuit(offsets, targets, multiplicity, 0)[:-1]
     # translate result into corresponding names of the nodes
-    sequence_list = [list(graph.nodes())[index]
-                     for index in sequence_index_list]
-
-    # combine all nodes into full sequence
-    full_sequence = ''
-    for index, node in enumerate(sequence_list):
-        if index == 0:
-            full_sequence += node
-        else:
-            full_sequence += node[-1]
-    return full_sequence
+    nodes = list(node_index)
+    sequence_list = [nodes[index] for index in sequence_index_list]
+
+    # combine all nodes into full sequence: first node in full, every next node adds its last letter
+    return sequence_list[0] + ''.join([node[-1] for node in sequence_list[1:]])
 
 
-def _make_eulerian_graph(graph: nx.MultiDiGraph):
+def _make_eulerian_graph(graph: nx.MultiDiGraph, summary: dict = None):
     '''
     Make the given graph Eulerian by adding an edge to connect the beginning and ending nodes if necessary.
 
-    Input: Graph to check and possibly make Eulerian.
+    Input: Graph to check and possibly make Eulerian, and optionally its degree_summary
+    if it was already made.
 
     Returns Eulertian graph
     '''
     # we know that graph is valid, so differ_degree is either 0 or 2
     # if 0, we have to do nothing
     # if 2, we have to connect beginning to ending node
-    begin = ''
-    end = ''
-    for node in graph.nodes():
-        if graph.in_degree(node) - graph.out_degree(node) == 1:
-            end = node
-        elif graph.in_degree(node) - graph.out_degree(node) == -1:
-            begin = node
-    # if begin and end are defined, if not they are still '' and return False
-    if begin and end:
-        graph.add_edge(end, begin)
+    if summary is None:
+        summary = degree_summary(graph)
+    if summary['begin'] is None or summary['end'] is None:
+        return
+    if isinstance(graph, (DeBruijnGraph, UnitigGraph)):
+        graph.add_edge_ids(summary['end'], summary['begin'])
+        return
+    nodes = list(graph.nodes())
+    graph.add_edge(nodes[summary['end']], nodes[summary['begin']])
+
+
+def _construct_native_dna_sequence(graph: DeBruijnGraph) -> str:
+    '''
+    Construct the DNA sequence of an Eulerian DeBruijnGraph.
+
+    Input: DeBruijnGraph that has an Eulerian circuit.
+
+    Returns the constructed DNA sequence.
+    '''
+    if graph.number_of_edges() == 0:
+        return ''
+    # the circuit starts and ends in the first node, the last one is left out
+    sequence_list = _eulerian_circuit(graph.offsets, graph.targets, graph.multiplicity, 0)[:-1]
+    # first node in full, every next node adds its last letter
+    return graph.label(sequence_list[0]) + graph.last_letters(sequence_list[1:])
+
+
+def _construct_unitig_dna_sequence(graph: UnitigGraph) -> str:
+    '''
+    Construct the DNA sequence of an Eulerian UnitigGraph.
+
+    Input: UnitigGraph that has an Eulerian circuit.
+
+    Returns the constructed DNA sequence, the same as for the full graph.
+    '''
+    if graph.number_of_edges() == 0:
+        return ''
+    # walk the unitigs from the first node, the last letter closes the circuit
+    circuit = _eulerian_circuit(graph.offsets, graph.targets, graph.multiplicity, 0,
+                                return_edges=True)
+    return graph.label(0) + graph.spelling(circuit)[:-1]
 
 
-def _from_edges_to_matrix(graph: nx.MultiDiGraph):
+def _eulerian_circuit(offsets: np.ndarray, targets: np.ndarray, multiplicity: np.ndarray,
+                      start: int, return_edges: bool = False) -> list:
     '''
-    Convert the given graph's edge representation into a matrix.
+    Find an Eulerian circuit with Hierholzer's algorithm, without recursion.
 
-    Input: graph to convert.
+    Input: edges in compressed sparse row form (edges of node i are
+    targets[offsets[i]:offsets[i + 1]]), multiplicity of every edge, the start node and
+    whether to return the edges instead of the nodes.
 
-    Returns matrix representing the connections between nodes.
+    Returns list of node ids visited by the circuit, starting and ending in the start node,
+    or list of the ids of the edges it follows.
     '''
-    # make matrix with overview of connections between nodes
-    edges_matrix = np.zeros(
-        (graph.number_of_nodes(), graph.number_of_nodes()), dtype=int)
-    for start_node, end_node in graph.edges():
-        start_index = list(graph.nodes()).index(start_node)
-        end_index = list(graph.nodes()).index(end_node)
-        # directed graph: only conncection from start to end
-        # this way rows represent nodes where the edge starts and
-        # columns represents nodes where the edge ends
-        # += 1 because one edge can be traversed multiple times
-        edges_matrix[start_index][end_index] += 1
-    return edges_matrix
+    offsets, targets = offsets.tolist(), targets.tolist()
+    remaining = multiplicity.tolist()
+    # next edge to try for every node, edges that are used up are never looked at again
+    cursor = offsets[:-1]
+    stack = [start]
+    # the edge that led to every node on the stack
+    arrived_by = [-1]
+    circuit = []
+    while stack:
+        node = stack[-1]
+        edge = cursor[node]
+        while edge < offsets[node + 1] and remaining[edge] == 0:
+            edge += 1
+        cursor[node] = edge
+        if edge < offsets[node + 1]:
+            # follow an unused edge
+            remaining[edge] -= 1
+            stack.append(targets[edge])
+            arrived_by.append(edge)
+        else:
+            # no unused edges left: the node is final, backtrack
+            circuit.append(arrived_by.pop() if return_edges else node)
+            stack.pop()
+    circuit.reverse()
+    # the start node was not reached by an edge
+    return circuit[1:] if return_edges else circuit
+
 
+# Try a range of k values on the same segments
 
-def _hierholzer_algorithm(matrix, starting_row_index: int, full_sequence: list) -> list:
+def sweep_k(json_data, ks: Iterable[int]) -> list:
     '''
-    Apply the Hierholzer's algorithm to find Eulerian circuits or paths in a graph.
+    Build the de Bruijn graph for several k and try to construct the DNA sequence of each.
+
+    Input: the DNA sequences in any form construct_graph accepts and the k values to try.
 
-    Input: Matrix representing the graph's connections, index of the row to start the algorithm
-    and list to store the sequence of nodes.
+    Returns list with a dictionary per k (in increasing order) with k, whether the graph
+    is valid, the number of nodes and edges, the constructed sequence (empty if the graph
+    is not valid), its length and the time it took in seconds.
 
-    Returns list representing the Eulerian path.
+    The segments are encoded once. The k-mers of every next k are made from those of
+    the previous k by shifting in one more nucleotide, instead of encoding all again.
     '''
-    # identify all values in this row that have a 1; meaning that they are an
-    # ending node of this edge
-    ending_nodes_index = np.where(matrix[starting_row_index] > 0)[0]
-    # use ending node as beginning node by using recursive function
-    for ending_node_index in ending_nodes_index:
-        # remove edge from the edge_matrix
-        matrix[starting_row_index][ending_node_index] -= 1
-        # recursive function: look at edges or ending node
-        _hierholzer_algorithm(matrix, ending_node_index, full_sequence)
+    results = []
+    for k, graph, start_time in _iter_k_graphs(list(_iter_dna_segments(json_data)),
+                                               sorted(set(ks))):
+        result = {'k': k, 'valid': False, 'nodes': graph.number_of_nodes(),
+                  'edges': graph.number_of_edges()}
+        unitig_graph = compact_graph(graph)
+        result['valid'] = is_valid_graph(unitig_graph)
+        result['output'] = construct_dna_sequence(unitig_graph) if result['valid'] else ''
+        result['length'] = len(result['output'])
+        result['seconds'] = time.perf_counter() - start_time
+        results += [result]
+    return results
+
+
+def best_k(results: list):
+    '''
+    Choose k from the results of sweep_k.
 
-        # if we have completed a cycle and need to backtrack we are at the end
-        # so we can add this node to our full_sequence list
-        full_sequence.insert(0, starting_row_index)
+    Input: list of results from sweep_k.
 
-        # stopping condition: if we have a matrix with all zeroes, all edges have been added
-        if (matrix == np.zeros(matrix.shape, dtype=int)).all():
-            # full_sequence.append(ending_node_index)
-            return full_sequence
+    Returns the result with the longest sequence among the k with a valid graph that has
+    edges, of those the largest k (a larger k resolves more repeats), or None if there
+    is no such k. A k longer than most segments leaves only the k-mers of the longest
+    ones, which can still give a valid graph of only a part of the sequence.
+    '''
+    valid_results = [result for result in results if result['valid'] and result['edges']]
+    if not valid_results:
+        return None
+    return max(valid_results, key=lambda result: (result['length'], result['k']))
+
+
+def _iter_k_graphs(segments: list, ks: list) -> Iterator:
+    '''
+    Build the DeBruijnGraph of the segments for every k.
+
+    Input: DNA strings or PackedSequences of the segments, in order, and the k values in
+    increasing order.
+
+    Yields k, the DeBruijnGraph and the time at which building it started.
+    '''
+    packed = [dna_data if isinstance(dna_data, PackedSequence)
+              else PackedSequence.from_string(dna_data) for dna_data in segments]
+    # all segments one after the other, k-mers over the border of two segments are left out
+    codes = np.concatenate([np.zeros(0, dtype=np.uint64)] + [
+        dna_data.codes().astype(np.uint64) for dna_data in packed])
+    segment_ids = np.repeat(np.arange(len(packed)), [len(dna_data) for dna_data in packed])
+    invalid_count = np.concatenate(([0], np.cumsum(np.concatenate(
+        [np.zeros(0, dtype=bool)] + [dna_data.invalid() for dna_data in packed]))))
+    n_codes = len(codes)
+    # k_mers[i] is the encoded k-mer of length current starting at position i
+    k_mers = np.zeros(n_codes, dtype=np.uint64)
+    current = 0
+    for k in ks:
+        start_time = time.perf_counter()
+        if k > _MAX_ENCODED_K:
+            yield k, DeBruijnGraph.from_segments(packed, k), start_time
+            continue
+        while current < k:
+            n_k_mers = max(n_codes - current, 0)
+            k_mers = (k_mers[:n_k_mers] << np.uint64(2)) | codes[current:current + n_k_mers]
+            current += 1
+        n_k_mers = len(k_mers)
+        keep = ((segment_ids[:n_k_mers] == segment_ids[k - 1:k - 1 + n_k_mers])
+                & (invalid_count[k:k + n_k_mers] == invalid_count[:n_k_mers]))
+        yield k, DeBruijnGraph.from_k_mer_counts(*_count_values(k_mers[keep]), k), start_time
 
 
 # Save DNA sequence or write the error message
@@ -415,20 +2102,582 @@ def save_output(s: str, filename: str):
         dna_file.write(s)
 
 
-# for running the file from the command line
-if __name__ == "__main__":
-    input_file = sys.argv[1]
-    _, x, k = input_file.split('_')
-    k, _ = k.split('.')
+# Cache the cleaned segments and k-mer counts on disk
 
-    dna_dataframe = read_csv(input_file)
-    dna_clean_dataframe = clean_data(dna_dataframe)
-    dna_json = generate_sequences(dna_clean_dataframe)
-    db_graph = construct_graph(dna_json, int(k))
-    plot_graph(db_graph, f'DNA_{x}.png')
-    if is_valid_graph(db_graph):
-        to_write_string = construct_dna_sequence(db_graph)
-        print(to_write_string)
+# bump when the layout of the cache files changes, so old entries are not used
+_CACHE_VERSION = 1
+
+
+class SegmentCache:
+    '''
+    Directory with the cleaned, packed segments of input files and their k-mer counts.
+
+    Every input file gets an entry named after the hash of its content, so a changed
+    file is never read from the cache. An entry holds the packed segments and, for every
+    k that was used, the k-mer count table, all as .npy files that are memory mapped
+    when loaded. If the entries take more than max_bytes, the least recently used ones
+    are removed.
+    '''
+
+    def __init__(self, directory: str, max_bytes: int = 2 ** 30):
+        '''
+        Input: directory of the cache (created if needed) and the size it may take.
+        '''
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, input_file: str) -> str:
+        '''
+        Input: name of the csv file.
+
+        Returns the name of the cache entry of the file: the hash of its content.
+        '''
+        file_hash = hashlib.blake2b(f'v{_CACHE_VERSION}'.encode(), digest_size=16)
+        with open(input_file, 'rb') as csv_file:
+            for block in iter(partial(csv_file.read, 2 ** 20), b''):
+                file_hash.update(block)
+        return file_hash.hexdigest()
+
+    def load_segments(self, key: str):
+        '''
+        Input: key of the entry.
+
+        Returns dictionary with a PackedSequence per segment number (in order of segment
+        number) backed by memory mapped arrays, or None if the entry does not exist.
+        '''
+        entry = os.path.join(self.directory, key)
+        if not os.path.isdir(entry):
+            return None
+        arrays = {name: np.load(os.path.join(entry, f'{name}.npy'), mmap_mode='r')
+                  for name in ['segment_nrs', 'lengths', 'packed', 'invalid', 'invalid_offsets']}
+        self._touch(entry)
+        packed_offsets = np.concatenate(([0], np.cumsum(-(-arrays['lengths'] // 4))))
+        invalid_offsets = arrays['invalid_offsets']
+        return {segment_nr: PackedSequence.from_packed(
+                    arrays['packed'][packed_offsets[i]:packed_offsets[i + 1]], length,
+                    arrays['invalid'][invalid_offsets[i]:invalid_offsets[i + 1]])
+                for i, (segment_nr, length) in enumerate(zip(arrays['segment_nrs'].tolist(),
+                                                              arrays['lengths'].tolist()))}
+
+    def store_segments(self, key: str, segments: dict) -> None:
+        '''
+        Input: key of the entry and dictionary with a PackedSequence per segment number.
+        '''
+        segment_nrs = sorted(segments)
+        invalid = [np.zeros(0, dtype=np.uint8) if segments[segment_nr]._invalid is None
+                   else segments[segment_nr]._invalid for segment_nr in segment_nrs]
+        arrays = {
+            'segment_nrs': np.array(segment_nrs, dtype=np.int64),
+            'lengths': np.array([len(segments[segment_nr]) for segment_nr in segment_nrs],
+                                dtype=np.int64),
+            'packed': np.concatenate([np.zeros(0, dtype=np.uint8)] + [
+                segments[segment_nr]._packed for segment_nr in segment_nrs]),
+            'invalid': np.concatenate([np.zeros(0, dtype=np.uint8)] + invalid),
+            'invalid_offsets': np.concatenate(([0], np.cumsum([len(bits) for bits in invalid],
+                                                              dtype=np.int64)))}
+        # write the entry next to the cache and move it in place at once, so other
+        # processes never see half an entry
+        entry = os.path.join(self.directory, key)
+        temporary = f'{entry}.{os.getpid()}.tmp'
+        os.makedirs(temporary, exist_ok=True)
+        for name, array in arrays.items():
+            np.save(os.path.join(temporary, f'{name}.npy'), array)
+        try:
+            os.rename(temporary, entry)
+        except OSError:
+            # another process stored the same file first
+            shutil.rmtree(temporary, ignore_errors=True)
+        self._evict(keep=entry)
+
+    def load_k_mer_counts(self, key: str, k: int):
+        '''
+        Input: key of the entry and length of the k-mers.
+
+        Returns the memory mapped k-mers and counts stored by store_k_mer_counts, or None
+        if they are not in the cache.
+        '''
+        entry = os.path.join(self.directory, key)
+        names = [os.path.join(entry, f'{name}_{k}.npy') for name in ['k_mers', 'counts']]
+        if not all(os.path.exists(name) for name in names):
+            return None
+        self._touch(entry)
+        return tuple(np.load(name, mmap_mode='r') for name in names)
+
+    def store_k_mer_counts(self, key: str, k: int, k_mers: np.ndarray, counts: np.ndarray) -> None:
+        '''
+        Input: key of an entry with stored segments, length of the k-mers and the k-mers
+        and counts from _count_k_mers.
+        '''
+        entry = os.path.join(self.directory, key)
+        if not os.path.isdir(entry):
+            return
+        for name, array in [('k_mers', k_mers), ('counts', counts)]:
+            temporary = os.path.join(entry, f'{name}_{k}.{os.getpid()}.tmp.npy')
+            np.save(temporary, array)
+            os.replace(temporary, os.path.join(entry, f'{name}_{k}.npy'))
+        self._evict(keep=entry)
+
+    def _touch(self, entry: str) -> None:
+        '''Mark the entry as used now, the modification time orders the entries for eviction.'''
+        try:
+            os.utime(entry)
+        except OSError:
+            pass
+
+    def _evict(self, keep: str) -> None:
+        '''Remove the least recently used entries until the cache fits in max_bytes.'''
+        entries = []
+        for name in os.listdir(self.directory):
+            entry = os.path.join(self.directory, name)
+            if name.endswith('.tmp') or not os.path.isdir(entry):
+                continue
+            size = sum(os.path.getsize(os.path.join(entry, file_name))
+                       for file_name in os.listdir(entry))
+            entries += [(os.path.getmtime(entry), size, entry)]
+        total = sum(size for _, size, _ in entries)
+        for _, size, entry in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if entry != keep:
+                shutil.rmtree(entry, ignore_errors=True)
+                total -= size
+
+
+def _cached_graph(cache: SegmentCache, input_file: str, k: int, workers: int = None,
+                  min_abundance: int = 1, counters: dict = None):
+    '''
+    Build the DeBruijnGraph of a csv file, reading and cleaning it only if it is not cached.
+
+    Input: the SegmentCache, name of the csv file, length of the k-mers, number of
+    processes that count the k-mers, the number of times a k-mer has to occur to be
+    used (all counts are cached, so the threshold can change between runs) and optionally
+    a dictionary that is filled with cache_hit (whether the file was not read) and, if it
+    was read, the counters of the cleaning (see _clean_counted).
+
+    Returns the DeBruijnGraph, the same as construct_graph on the cleaned file.
+    '''
+    counters = {} if counters is None else counters
+    counters['cache_hit'] = True
+    key = cache.key(input_file)
+    table = cache.load_k_mer_counts(key, k) if k <= _MAX_ENCODED_K else None
+    if table is None:
+        segments = cache.load_segments(key)
+        if segments is None:
+            counters['cache_hit'] = False
+            segments = pack_segments(_clean_counted(read_csv(input_file), counters))
+            cache.store_segments(key, segments)
+        if k > _MAX_ENCODED_K:
+            return construct_graph(segments, k, native=True, min_abundance=min_abundance)
+        segments = list(_iter_dna_segments(segments))
+        if workers is not None and workers > 1 and len(segments) > 1:
+            table = _sharded_k_mer_counts(segments, k, workers)
+        else:
+            table = _count_k_mers(segments, k)
+        cache.store_k_mer_counts(key, k, *table)
+    return DeBruijnGraph.from_k_mer_counts(*_filter_k_mer_counts(*table, min_abundance), k)
+
+
+def _clean_counted(df: pd.DataFrame, counters: dict) -> pd.DataFrame:
+    '''
+    Input: DataFrame as read_csv gives and the dictionary of counters of a stage.
+
+    Returns the DataFrame cleaned like clean_data, and records rows, positions_dropped,
+    segments_with_errors, segments_removed and segments_kept in the counters.
+    '''
+    clean_df, to_remove_segment = _clean_positions(df)
+    counters['rows'] = len(df)
+    counters['positions_dropped'] = len(df) - len(clean_df)
+    counters['segments_with_errors'] = len(to_remove_segment)
+    to_remove_segment = _clean_segments(clean_df, to_remove_segment)
+    clean_df = _remove_segments(clean_df, to_remove_segment)
+    counters['segments_removed'] = len(set(to_remove_segment))
+    counters['segments_kept'] = clean_df['SegmentNr'].nunique()
+    return clean_df
+
+
+# Measure the stages of the pipeline
+
+class PipelineReport:
+    '''
+    Wall time, peak memory and counters of every stage of one run of the pipeline.
+
+    Every stage runs inside `with report.stage(name) as counters:` and fills in its
+    counters (rows read, segments removed, nodes, ...). The peak memory is the most
+    memory allocated through Python and NumPy during the stage on top of what was in
+    use when it started, measured with tracemalloc; tracing slows the run down, so it
+    is only done when track_memory is set.
+
+    Hooks plug in a profiler: a hook is called with the name of every stage and
+    returns a context manager that is entered around the stage, for example
+    `lambda stage: cProfile.Profile()`.
+    '''
+
+    def __init__(self, track_memory: bool = False, hooks: Iterable = None):
+        '''
+        Input: whether to measure the peak memory of every stage and the hooks.
+        '''
+        self.track_memory = track_memory
+        self.hooks = list(hooks or [])
+        self.stages = []
+
+    @contextlib.contextmanager
+    def stage(self, name: str) -> Iterator[dict]:
+        '''
+        Input: name of the stage.
+
+        Yields the dictionary of counters of the stage, that is recorded (with the wall
+        time and the peak memory) in self.stages when the stage ends.
+        '''
+        counters = {}
+        with contextlib.ExitStack() as hooks:
+            for hook in self.hooks:
+                hooks.enter_context(hook(name))
+            with self._measure_memory() as peak_memory:
+                start_time = time.perf_counter()
+                yield counters
+                seconds = time.perf_counter() - start_time
+        # NumPy scalars can not be written to JSON
+        counters = {key: value.item() if isinstance(value, np.generic) else value
+                    for key, value in counters.items()}
+        self.stages += [{'stage': name, 'seconds': seconds, 'peak_memory': peak_memory[0],
+                         'counters': counters}]
+
+    @contextlib.contextmanager
+    def _measure_memory(self) -> Iterator[list]:
+        '''Yields a list that holds the peak memory in bytes (or None) once the block ends.'''
+        peak_memory = [None]
+        if not self.track_memory:
+            yield peak_memory
+            return
+        import tracemalloc
+        # leave tracing on if it was started outside the pipeline
+        was_tracing = tracemalloc.is_tracing()
+        if was_tracing:
+            tracemalloc.reset_peak()
+        else:
+            tracemalloc.start()
+        start_memory = tracemalloc.get_traced_memory()[0]
+        try:
+            yield peak_memory
+        finally:
+            peak_memory[0] = tracemalloc.get_traced_memory()[1] - start_memory
+            if not was_tracing:
+                tracemalloc.stop()
+
+
+class StageProfiler:
+    '''
+    Hook for PipelineReport that profiles every stage with cProfile.
+
+    The statistics of a stage are written to {directory}/{stage}.prof, to be read with
+    pstats or snakeviz.
+    '''
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    @contextlib.contextmanager
+    def __call__(self, stage: str) -> Iterator[None]:
+        import cProfile
+        with cProfile.Profile() as profiler:
+            yield
+        profiler.dump_stats(os.path.join(self.directory, f'{stage}.prof'))
+
+
+def _graph_counters(graph: DeBruijnGraph, counters: dict) -> None:
+    '''Record the size of a DeBruijnGraph in the counters of a stage.'''
+    counters['nodes'] = graph.number_of_nodes()
+    # parallel edges are stored once with their multiplicity
+    counters['edges'] = len(graph.sources)
+    counters['k_mers'] = graph.number_of_edges()
+
+
+# Run the whole pipeline on one or many input files
+
+def assemble_file(input_file: str, stream: bool = False, block_size: int = 2 ** 24,
+                  plot: bool = False, save_json: bool = False, json_layout: str = 'records',
+                  output_dir: str = '.', workers: int = None, cache_dir: str = None,
+                  cache_size: int = 2 ** 30, min_abundance: int = 1, track_memory: bool = False,
+                  hooks: Iterable = None) -> dict:
+    '''
+    Reconstruct the DNA sequence of one DNA_{x}_{k}.csv file and write it to DNA_{x}.txt.
+
+    Input: name of the csv file, whether to stream it and the bytes per block, whether to
+    plot the graph and to save the JSON (with its layout), the directory for the output,
+    the number of processes that count the k-mers, optionally the directory and size
+    in bytes of a SegmentCache, the number of times a k-mer has to occur to be used in
+    the graph, and whether to measure the peak memory of every stage
+    and the hooks around every stage (see PipelineReport). Cached files are not read
+    again (unless the JSON has to be saved); the cache is filled by reading the file at
+    once, so it can not be combined with stream.
+
+    Returns dictionary with the file name, x, k, whether the graph is valid, the text
+    that was written, the time it took in seconds and the report of every stage.
+    '''
+    if stream and cache_dir is not None:
+        raise ValueError('a file is either streamed or cached, not both')
+    start_time = time.perf_counter()
+    x, k = _parse_file_name(input_file)
+    output_name = os.path.join(output_dir, f'DNA_{x}')
+    report = PipelineReport(track_memory, hooks)
+
+    if cache_dir is not None and not save_json:
+        with report.stage('cached_graph') as counters:
+            db_graph = _cached_graph(SegmentCache(cache_dir, cache_size), input_file, k, workers,
+                                     min_abundance, counters)
+            _graph_counters(db_graph, counters)
+    elif stream:
+        with report.stage('construct_graph_streaming') as counters:
+            db_graph = construct_graph_streaming(input_file, k, block_size, native=True,
+                                                 min_abundance=min_abundance, counters=counters)
+            _graph_counters(db_graph, counters)
+    else:
+        with report.stage('read_csv') as counters:
+            dna_dataframe = read_csv(input_file)
+            counters['rows'] = len(dna_dataframe)
+        # the steps of clean_data, to see which one takes the time
+        with report.stage('clean_positions') as counters:
+            dna_clean_dataframe, to_remove_segment = _clean_positions(dna_dataframe)
+            counters['positions_dropped'] = len(dna_dataframe) - len(dna_clean_dataframe)
+            counters['segments_with_errors'] = len(to_remove_segment)
+        with report.stage('clean_segments') as counters:
+            to_remove_segment = _clean_segments(dna_clean_dataframe, to_remove_segment)
+            dna_clean_dataframe = _remove_segments(dna_clean_dataframe, to_remove_segment)
+            counters['segments_removed'] = len(set(to_remove_segment))
+            counters['segments_kept'] = dna_clean_dataframe['SegmentNr'].nunique()
+        if save_json:
+            with report.stage('generate_sequences') as counters:
+                json_text = generate_sequences(dna_clean_dataframe, json_layout)
+                with open(f'{output_name}.json', mode='w') as json_file:
+                    json_file.write(json_text)
+                counters['characters'] = len(json_text)
+        with report.stage('construct_graph') as counters:
+            db_graph = construct_graph(dna_clean_dataframe, k, native=True, workers=workers,
+                                       min_abundance=min_abundance)
+            _graph_counters(db_graph, counters)
+    if plot:
+        with report.stage('plot_graph') as counters:
+            counters['complete'] = plot_graph(db_graph, f'{output_name}.png')
+    # only the branching points matter for the validity check and the walk
+    with report.stage('compact_graph') as counters:
+        db_graph = compact_graph(db_graph)
+        counters['nodes'] = db_graph.number_of_nodes()
+        counters['unitigs'] = len(db_graph.sources)
+    with report.stage('is_valid_graph') as counters:
+        valid = is_valid_graph(db_graph)
+        counters['valid'] = valid
+    if valid:
+        with report.stage('construct_dna_sequence') as counters:
+            to_write_string = construct_dna_sequence(db_graph)
+            counters['length'] = len(to_write_string)
     else:
         to_write_string = 'DNA sequence can not be constructed.'
-    save_output(to_write_string, f'DNA_{x}')
+    with report.stage('save_output'):
+        save_output(to_write_string, output_name)
+    return {'file': input_file, 'x': x, 'k': k, 'valid': valid, 'output': to_write_string,
+            'seconds': time.perf_counter() - start_time, 'stages': report.stages}
+
+
+def assemble_k_sweep(input_file: str, ks: Iterable[int], output_dir: str = '.',
+                     cache_dir: str = None, cache_size: int = 2 ** 30) -> list:
+    '''
+    Try several k on one csv file and write the DNA sequence of the best k to DNA_{x}.txt.
+
+    Input: name of the csv file, the k values to try, the directory for the output and
+    optionally the directory and size in bytes of a SegmentCache.
+
+    Returns the list of results from sweep_k; the k in the file name is not used.
+    '''
+    x, _ = _parse_file_name(input_file)
+    segments = None
+    if cache_dir is not None:
+        cache = SegmentCache(cache_dir, cache_size)
+        key = cache.key(input_file)
+        segments = cache.load_segments(key)
+    if segments is None:
+        segments = clean_data(read_csv(input_file), packed=True)
+        if cache_dir is not None:
+            cache.store_segments(key, segments)
+    results = sweep_k(segments, ks)
+    best = best_k(results)
+    save_output(best['output'] if best else 'DNA sequence can not be constructed.',
+                os.path.join(output_dir, f'DNA_{x}'))
+    return results
+
+
+def _parse_file_name(input_file: str):
+    '''
+    Read x and k from an input file name of the form DNA_{x}_{k}.csv.
+
+    Input: name (or path) of the csv file.
+
+    Returns x (string) and k (integer).
+    '''
+    _, x, k = os.path.basename(input_file).split('_')
+    k, _ = k.split('.')
+    return x, int(k)
+
+
+def assemble_batch(input_files: list, workers: int = None, **options) -> list:
+    '''
+    Run assemble_file on many files in parallel, one process per file at a time.
+
+    Input: list of csv file names, number of worker processes (default: one per CPU)
+    and the options of assemble_file.
+
+    Returns list with the result of assemble_file for every file, in input order. A file
+    that fails does not stop the others: its result is a dictionary with the file name,
+    the error and the time it took in seconds.
+    '''
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(input_files) <= 1:
+        return [_assemble_file_safely(input_file, **options) for input_file in input_files]
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(max_workers=min(workers, len(input_files))) as pool:
+        return list(pool.map(partial(_assemble_file_safely, **options), input_files))
+
+
+def _assemble_file_safely(input_file: str, **options) -> dict:
+    '''
+    Input: name of the csv file and the options of assemble_file.
+
+    Returns the result of assemble_file, or dictionary with the file name, the error
+    and the time in seconds if it raised an exception.
+    '''
+    start_time = time.perf_counter()
+    try:
+        return assemble_file(input_file, **options)
+    except Exception as error:
+        return {'file': input_file, 'error': f'{type(error).__name__}: {error}',
+                'seconds': time.perf_counter() - start_time}
+
+
+def _write_report(filename: str, results: list) -> None:
+    '''
+    Write the stage reports of assembled files to a JSON file.
+
+    Input: name of the JSON file and the results of assemble_file (or of a file that
+    failed, those are written as they are).
+    '''
+    report = [result if 'error' in result else
+              {'file': result['file'], 'x': result['x'], 'k': result['k'],
+               'valid': result['valid'],
+               'length': len(result['output']) if result['valid'] else 0,
+               'seconds': result['seconds'], 'stages': result['stages']} for result in results]
+    with open(filename, mode='w') as report_file:
+        json.dump({'files': len(results),
+                   'failed': sum('error' in result for result in results),
+                   'results': report}, report_file, indent=2)
+
+
+def _expand_inputs(inputs: list) -> list:
+    '''
+    Turn directories and glob patterns into a sorted list of input files.
+
+    Input: list of directories (all DNA_*_*.csv files in it), glob patterns or file names.
+
+    Returns list of csv file names without duplicates.
+    '''
+    input_files = []
+    for pattern in inputs:
+        if os.path.isdir(pattern):
+            pattern = os.path.join(pattern, 'DNA_*_*.csv')
+        input_files += sorted(glob.glob(pattern)) or [pattern]
+    return list(dict.fromkeys(input_files))
+
+
+# for running the file from the command line
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description='Reconstruct a DNA sequence from a DNA_{x}_{k}.csv file.')
+    parser.add_argument('inputs', nargs='+', metavar='input_file',
+                        help='csv file, or with --batch directories and glob patterns')
+    parser.add_argument('--batch', action='store_true',
+                        help='assemble all given files in parallel and report the timings')
+    parser.add_argument('--workers', type=int,
+                        help='number of processes: per file in batch mode (default: one per '
+                             'CPU), otherwise to count the k-mers of one large file')
+    parser.add_argument('--output-dir', default='.',
+                        help='directory to write the output files to')
+    parser.add_argument('--stream', action='store_true',
+                        help='read the file in blocks through a memory map instead of '
+                             'loading it at once, for files larger than memory')
+    parser.add_argument('--block-size', type=int, default=16,
+                        help='megabytes parsed at a time in streaming mode')
+    parser.add_argument('--plot', action='store_true',
+                        help='also plot the graph to DNA_{x}.png (large graphs in part)')
+    parser.add_argument('--cache-dir',
+                        help='keep the cleaned segments and k-mer counts in this directory, '
+                             'so later runs on the same file skip reading and cleaning it')
+    parser.add_argument('--cache-size', type=int, default=1024,
+                        help='megabytes the cache may take before old entries are removed')
+    parser.add_argument('--k-sweep', type=int, nargs=2, metavar=('K_MIN', 'K_MAX'),
+                        help='try every k from K_MIN to K_MAX instead of the k in the file '
+                             'name and keep the k with the longest valid sequence (the '
+                             'largest of those on a tie)')
+    parser.add_argument('--min-abundance', type=int, default=1,
+                        help='leave k-mers that occur less often than this out of the graph, '
+                             'to drop the k-mers of sequencing errors in overlapping segments')
+    parser.add_argument('--save-json', action='store_true',
+                        help='also write the cleaned sequences to DNA_{x}.json')
+    parser.add_argument('--json-layout', choices=['records', 'segments'], default='records',
+                        help='layout of the JSON file written by --save-json')
+    parser.add_argument('--report', metavar='FILE',
+                        help='write the wall time, peak memory and counters of every stage '
+                             'to this JSON file')
+    parser.add_argument('--profile', metavar='DIR',
+                        help='profile every stage with cProfile and write the statistics '
+                             'to DIR/{stage}.prof (single input file only)')
+    arguments = parser.parse_args()
+    options = {'stream': arguments.stream, 'block_size': arguments.block_size * 2 ** 20,
+               'save_json': arguments.save_json, 'json_layout': arguments.json_layout,
+               'output_dir': arguments.output_dir, 'plot': arguments.plot,
+               'cache_dir': arguments.cache_dir, 'cache_size': arguments.cache_size * 2 ** 20,
+               'min_abundance': arguments.min_abundance,
+               'track_memory': arguments.report is not None}
+    if arguments.profile and (arguments.batch or len(arguments.inputs) > 1):
+        parser.error('--profile works on a single input file')
+    if arguments.stream and arguments.cache_dir:
+        parser.error('--stream can not be combined with --cache-dir, filling the cache '
+                     'reads the whole file at once')
+
+    if arguments.batch:
+        start_time = time.perf_counter()
+        results = assemble_batch(_expand_inputs(arguments.inputs), arguments.workers, **options)
+        for result in results:
+            if 'error' in result:
+                status = f"failed ({result['error']})"
+            else:
+                status = f"{len(result['output'])} bp" if result['valid'] else 'not valid'
+            print(f"{result['file']}: {status}, {result['seconds']:.3f} s")
+        print(f"{len(results)} files, {sum(result.get('valid', False) for result in results)} "
+              f"valid, {sum('error' in result for result in results)} failed, "
+              f"{sum(result['seconds'] for result in results):.3f} s of work in "
+              f"{time.perf_counter() - start_time:.3f} s")
+        if arguments.report:
+            _write_report(arguments.report, results)
+    elif arguments.k_sweep:
+        if len(arguments.inputs) > 1:
+            parser.error('--k-sweep works on a single input file')
+        results = assemble_k_sweep(arguments.inputs[0], range(arguments.k_sweep[0],
+                                                              arguments.k_sweep[1] + 1),
+                                   arguments.output_dir, arguments.cache_dir,
+                                   arguments.cache_size * 2 ** 20)
+        for result in results:
+            status = f"{result['length']} bp" if result['valid'] else 'not valid'
+            print(f"k={result['k']}: {result['nodes']} nodes, {result['edges']} edges, "
+                  f"{status}, {result['seconds']:.3f} s")
+        best = best_k(results)
+        print(f"best k: {best['k']}" if best else 'no k gives a valid graph')
+    else:
+        if len(arguments.inputs) > 1:
+            parser.error('give a single input file or use --batch')
+        hooks = [StageProfiler(arguments.profile)] if arguments.profile else None
+        result = assemble_file(arguments.inputs[0], workers=arguments.workers, hooks=hooks,
+                               **options)
+        if result['valid']:
+            print(result['output'])
+        if arguments.report:
+            _write_report(arguments.report, [result])
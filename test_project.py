@@ -1,9 +1,57 @@
-from project import clean_data, generate_sequences, construct_graph, is_valid_graph
-from pytest import mark
+from project import read_csv, clean_data, generate_sequences, construct_graph, is_valid_graph
+from project import construct_graph_streaming, _clean_positions, PackedSequence
+from project import _encode_k_mers, _decode_k_mers, _generate_k_mers
+from project import DeBruijnGraph, construct_dna_sequence, assemble_batch, _expand_inputs
+from project import compact_graph
+from pytest import mark, raises
+import project
+from benchmark import legacy_clean_data, legacy_clean_positions, random_dna_frame
+from benchmark import random_genome_graph, random_genome_segments, legacy_construct_dna_sequence
+from benchmark import sequencing_frame, benchmark_pipeline, peak_memory, write_random_csv
+import contextlib
+import json
+import os
+import subprocess
+import sys
 import pandas as pd
+import numpy as np
 import networkx as nx
 
 
+@mark.parametrize(
+    'csv_text, expected',
+    [
+        (
+            '1,1,1,0,0,0\n1,2,0,0,0,1\n2,1,0,1,0,0\n',
+            pd.DataFrame(data=[
+                [1, 1, 1, 0, 0, 0],
+                [1, 2, 0, 0, 0, 1],
+                [2, 1, 0, 1, 0, 0]],
+                columns=['SegmentNr', 'Position', 'A', 'C', 'G', 'T'])
+        ),
+        (
+            # whitespace around values and no newline at the end
+            '1, 1, 0, 0, 1, 0 \n12, 103, 0, 0, 0, 0',
+            pd.DataFrame(data=[
+                [1, 1, 0, 0, 1, 0],
+                [12, 103, 0, 0, 0, 0]],
+                columns=['SegmentNr', 'Position', 'A', 'C', 'G', 'T'])
+        ),
+        (
+            # empty file
+            '',
+            pd.DataFrame(data=[],
+                         columns=['SegmentNr', 'Position', 'A', 'C', 'G', 'T'])
+        )
+    ])
+def test_read_csv(tmp_path, csv_text: str, expected: pd.DataFrame) -> None:
+    csv_file = tmp_path / 'DNA_1_3.csv'
+    csv_file.write_text(csv_text)
+    dna_df = read_csv(str(csv_file))
+    assert list(dna_df.dtypes) == ['int32', 'int32', 'int8', 'int8', 'int8', 'int8']
+    assert dna_df.values.tolist() == expected.values.tolist()
+
+
 @mark.parametrize(
     'dna_df, expected',
     [
@@ -214,6 +262,25 @@ def test_clean_data(dna_df: pd.DataFrame, expected: pd.DataFrame) -> None:
     assert clean_data(dna_df).equals(expected)
 
 
+@mark.parametrize('seed', range(5))
+def test_clean_data_randomized(seed: int) -> None:
+    # the vectorized cleaning gives the same result as the original row by row cleaning
+    dna_df = random_dna_frame(100, error_rate=0.05, seed=seed)
+    assert clean_data(dna_df).equals(legacy_clean_data(dna_df))
+
+    cleaned_df, to_remove_segment = _clean_positions(dna_df)
+    expected_df, expected_to_remove_segment = legacy_clean_positions(dna_df)
+    assert cleaned_df.equals(expected_df)
+    assert to_remove_segment == [int(segment) for segment in expected_to_remove_segment]
+
+
+def test_clean_data_fingerprint_collision(monkeypatch) -> None:
+    # all segments get the same fingerprint, only really equal segments may be removed
+    monkeypatch.setattr(project, '_segment_fingerprint', lambda values: b'')
+    dna_df = random_dna_frame(100, error_rate=0.05, seed=0)
+    assert clean_data(dna_df).equals(legacy_clean_data(dna_df))
+
+
 @mark.parametrize(
     'dna_df, expected_json_str',
     [(
@@ -270,6 +337,43 @@ def test_generate_sequences(dna_df: pd.DataFrame, expected_json_str: str) -> Non
     assert (generate_sequences(dna_df) == expected_json_str)
 
 
+@mark.parametrize(
+    'dna_df, expected_json_str',
+    [
+        (
+            pd.DataFrame(data=[
+                [1, 1, 0, 0, 0, 1],
+                [1, 2, 0, 0, 0, 1],
+                [2, 1, 0, 1, 0, 0],
+                [2, 2, 1, 0, 0, 0],
+                [2, 3, 0, 0, 1, 0],
+                # invalid position
+                [3, 1, 0, 0, 0, 0]],
+                columns=['SegmentNr', 'Position', 'A', 'C', 'G', 'T']),
+            '[{"SegmentNr":1,"Sequence":"TT"},{"SegmentNr":2,"Sequence":"CAG"},' +
+            '{"SegmentNr":3,"Sequence":"N"}]'
+        ),
+        (
+            # empty dataframe
+            pd.DataFrame(data=[],
+                         columns=['SegmentNr', 'Position', 'A', 'C', 'G', 'T']),
+            '[]'
+        )
+    ])
+def test_generate_sequences_segments(dna_df: pd.DataFrame, expected_json_str: str) -> None:
+    assert generate_sequences(dna_df, 'segments') == expected_json_str
+
+
+@mark.parametrize('seed', range(3))
+def test_construct_graph_segments_layout(seed: int) -> None:
+    clean_df = clean_data(random_dna_frame(100, error_rate=0.02, seed=seed))
+    for native in [False, True]:
+        graph = construct_graph(generate_sequences(clean_df, 'segments'), 3, native=native)
+        records_graph = construct_graph(generate_sequences(clean_df), 3, native=native)
+        assert list(graph.nodes()) == list(records_graph.nodes())
+        assert sorted(graph.edges()) == sorted(records_graph.edges())
+
+
 @mark.parametrize(
     'json_data, k,  expected_edge_list',
     [
@@ -376,6 +480,208 @@ def test_generate_sequences(dna_df: pd.DataFrame, expected_json_str: str) -> Non
 def test_construct_graph(json_data: str, k: int, expected_edge_list: list) -> None:
     assert (sorted(list(construct_graph(json_data, k).edges()))
             ) == sorted(expected_edge_list)
+    assert (sorted(list(construct_graph(json_data, k, native=True).edges()))
+            ) == sorted(expected_edge_list)
+
+
+@mark.parametrize(
+    'values, expected_str',
+    [
+        ([[1, 0, 0, 0], [0, 1, 0, 0], [0, 0, 1, 0], [0, 0, 0, 1], [0, 0, 0, 1]], 'ACGTT'),
+        # all zeros and multiple ones are invalid positions
+        ([[0, 0, 0, 1], [0, 0, 0, 0], [1, 0, 1, 0], [0, 1, 0, 0]], 'TNNC'),
+        ([], '')
+    ])
+def test_packed_sequence(values: list, expected_str: str) -> None:
+    packed_sequence = PackedSequence.from_one_hot(np.array(values))
+    assert len(packed_sequence) == len(expected_str)
+    assert str(packed_sequence) == expected_str
+    assert list(packed_sequence.invalid()) == [letter == 'N' for letter in expected_str]
+    if 'N' not in expected_str:
+        assert PackedSequence.from_string(expected_str) == packed_sequence
+    # 2 bits per nucleotide
+    assert packed_sequence.nbytes <= (len(expected_str) + 3) // 4 * (2 if 'N' in expected_str else 1)
+
+
+@mark.parametrize('seed', range(3))
+def test_construct_graph_packed(seed: int) -> None:
+    dna_df = random_dna_frame(100, error_rate=0.02, seed=seed)
+    packed_segments = clean_data(dna_df, packed=True)
+    assert all(isinstance(sequence, PackedSequence) for sequence in packed_segments.values())
+    assert sorted(construct_graph(packed_segments, 3).edges()) == sorted(
+        construct_graph(generate_sequences(clean_data(dna_df)), 3).edges())
+
+
+@mark.parametrize(
+    'csv_text, k',
+    [
+        # ATTACTC and TTACG, segment 3 has a missing position
+        (
+            '1,1,1,0,0,0\n1,2,0,0,0,1\n1,3,0,0,0,1\n1,4,1,0,0,0\n1,5,0,1,0,0\n' +
+            '1,6,0,0,0,1\n1,7,0,1,0,0\n2,1,0,0,0,1\n2,2,0,0,0,1\n2,3,1,0,0,0\n' +
+            '2,4,0,1,0,0\n2,5,0,0,1,0\n3,1,1,0,0,0\n3,3,0,0,0,1\n',
+            3
+        ),
+        # duplicate position with equal values and duplicate segments (1 and 3)
+        (
+            '1,1,1,0,0,0\n1,2,0,0,1,0\n1,3,0,1,0,0\n2,1,0,0,1,0\n2,2,0,1,0,0\n' +
+            '2,2,0,1,0,0\n2,3,0,0,0,1\n3,1,1,0,0,0\n3,2,0,0,1,0\n3,3,0,1,0,0\n',
+            2
+        ),
+        # empty file
+        ('', 3)
+    ])
+def test_construct_graph_streaming(tmp_path, csv_text: str, k: int) -> None:
+    csv_file = tmp_path / 'DNA_1_3.csv'
+    csv_file.write_text(csv_text)
+    expected_edge_list = sorted(construct_graph(
+        generate_sequences(clean_data(read_csv(str(csv_file)))), k).edges())
+    # blocks smaller than a line, about one line and larger than a segment
+    for block_size in [1, 2, 12, 100]:
+        assert sorted(construct_graph_streaming(
+            str(csv_file), k, block_size).edges()) == expected_edge_list
+
+
+def test_construct_graph_streaming_not_contiguous(tmp_path) -> None:
+    csv_file = tmp_path / 'DNA_1_3.csv'
+    csv_file.write_text('1,1,1,0,0,0\n2,1,0,1,0,0\n1,2,0,0,1,0\n')
+    with raises(ValueError):
+        construct_graph_streaming(str(csv_file), 2, 1)
+
+
+@mark.parametrize('seed', range(3))
+def test_construct_graph_streaming_randomized(tmp_path, seed: int) -> None:
+    csv_file = str(tmp_path / 'DNA_1_4.csv')
+    random_dna_frame(100, error_rate=0.02, seed=seed).to_csv(csv_file, header=False, index=False)
+    expected_edge_list = sorted(construct_graph(clean_data(read_csv(csv_file)), 4).edges())
+    for block_size in [7, 500, 10 ** 6]:
+        assert sorted(construct_graph_streaming(
+            csv_file, 4, block_size, native=True).edges()) == expected_edge_list
+    expected_edge_list = sorted(construct_graph(clean_data(read_csv(csv_file)), 4,
+                                                min_abundance=2).edges())
+    assert sorted(construct_graph_streaming(csv_file, 4, 500, native=True,
+                                            min_abundance=2).edges()) == expected_edge_list
+
+
+@mark.parametrize('seed', range(3))
+def test_construct_graph_streaming_unsorted(tmp_path, seed: int) -> None:
+    # segments that are not sorted on number give the same nodes in the same order
+    csv_file = str(tmp_path / 'DNA_1_9.csv')
+    sequencing_frame(400, k=9, segment_length=30, seed=seed)[0].to_csv(
+        csv_file, header=False, index=False)
+    clean_df = clean_data(read_csv(csv_file))
+    for k in [9, 40]:
+        expected_graph = construct_graph(clean_df, k)
+        expected_native_graph = construct_graph(clean_df, k, native=True)
+        for block_size in [50, 10 ** 6]:
+            graph = construct_graph_streaming(csv_file, k, block_size)
+            assert list(graph.nodes()) == list(expected_graph.nodes())
+            assert list(graph.edges()) == list(expected_graph.edges())
+            native_graph = construct_graph_streaming(csv_file, k, block_size, native=True)
+            assert native_graph.labels == expected_native_graph.labels
+            assert native_graph.edges() == expected_native_graph.edges()
+
+
+@mark.parametrize('seed', range(6))
+def test_incremental_assembler(seed: int) -> None:
+    # after every batch the graph is the same as cleaning all batches so far at once
+    if seed % 2:
+        dna_df = random_dna_frame(60, error_rate=0.05, seed=seed)
+    else:
+        dna_df = sequencing_frame(300, k=7, segment_length=20, error_rate=0.05, seed=seed)[0]
+    segment_nrs = pd.unique(dna_df['SegmentNr'])
+    for k in [3, 7, 34]:
+        assembler = project.IncrementalAssembler(k)
+        batches = []
+        for batch_segment_nrs in np.array_split(segment_nrs, 4):
+            batches += [dna_df[dna_df['SegmentNr'].isin(batch_segment_nrs)]]
+            assembler.add_segments(batches[-1])
+            expected_graph = construct_graph(clean_data(pd.concat(batches)), k, native=True)
+            graph = assembler.graph()
+            assert graph.labels == expected_graph.labels
+            assert graph.edges() == expected_graph.edges()
+            assert assembler.is_valid() is is_valid_graph(expected_graph)
+        expected_sequence = construct_dna_sequence(expected_graph)
+        assert assembler.construct_dna_sequence() == (
+            expected_sequence if assembler.is_valid() else None)
+
+
+def test_incremental_assembler_retract() -> None:
+    # a later copy with a missing position retracts the first copy and adds nothing
+    assembler = project.IncrementalAssembler(3)
+    assert assembler.add_segments(pd.DataFrame(
+        [[1, 1, 1, 0, 0, 0], [1, 2, 0, 1, 0, 0], [1, 3, 0, 0, 1, 0], [1, 4, 0, 0, 0, 1]],
+        columns=project._COLUMNS)) == {'segments': 1, 'kept': 1, 'retracted': 0}
+    assert assembler.construct_dna_sequence() == 'ACGT'
+    second_batch = pd.DataFrame(
+        [[2, 1, 1, 0, 0, 0], [2, 2, 0, 1, 0, 0], [2, 4, 0, 0, 1, 0], [2, 5, 0, 0, 0, 1]],
+        columns=project._COLUMNS)
+    assert assembler.add_segments(second_batch) == {'segments': 1, 'kept': 0, 'retracted': 1}
+    assert assembler.graph().number_of_edges() == 0
+    assert assembler.is_valid()
+    with raises(ValueError):
+        assembler.add_segments(second_batch)
+
+
+def test_fingerprint_collision_streaming(tmp_path, monkeypatch) -> None:
+    # all segments get the same fingerprint, only really equal segments may be removed
+    csv_file = str(tmp_path / 'DNA_1_4.csv')
+    dna_df = random_dna_frame(100, error_rate=0.05, seed=1)
+    dna_df.to_csv(csv_file, header=False, index=False)
+    expected_graph = construct_graph(clean_data(read_csv(csv_file)), 4, native=True)
+    monkeypatch.setattr(project, '_segment_fingerprint', lambda values: b'')
+    graph = construct_graph_streaming(csv_file, 4, 500, native=True)
+    assert graph.labels == expected_graph.labels
+    assert graph.edges() == expected_graph.edges()
+    assembler = project.IncrementalAssembler(4)
+    for batch_segment_nrs in np.array_split(pd.unique(dna_df['SegmentNr']), 3):
+        assembler.add_segments(dna_df[dna_df['SegmentNr'].isin(batch_segment_nrs)])
+    assert sorted(assembler.graph().edges()) == sorted(expected_graph.edges())
+
+
+def test_iter_segment_blocks(tmp_path) -> None:
+    # spaces, windows line ends, empty lines and negative values are parsed like read_csv
+    csv_file = tmp_path / 'DNA_1_3.csv'
+    csv_file.write_bytes(b'1, 1, 1,0,0,0\r\n1,2,0,0,0,1\n\n2,1,0,-1,0,0\n2,2,0,1,0,1')
+    expected_df = read_csv(str(csv_file))
+    for block_size in [1, 20, 100]:
+        blocks = list(project.iter_segment_blocks(str(csv_file), block_size))
+        assert all(block.dtypes.equals(expected_df.dtypes) for block in blocks)
+        assert pd.concat(blocks, ignore_index=True).equals(expected_df)
+        assert [segment_df['SegmentNr'].iat[0] for segment_df in
+                project.iter_segments(str(csv_file), block_size)] == [1, 2]
+    for csv_text in ['1,1,1,0,0\n', '1,1,1,0,0,0.5\n']:
+        csv_file.write_text(csv_text)
+        with raises(ValueError):
+            list(project.iter_segment_blocks(str(csv_file)))
+
+
+@mark.skipif(not sys.platform.startswith('linux'), reason='reads the peak memory from /proc')
+def test_iter_segment_blocks_memory(tmp_path) -> None:
+    # a file that is one long segment is held once, not once per block it spans
+    csv_file = str(tmp_path / 'DNA_1_5.csv')
+    write_random_csv(csv_file, 10 ** 6, segment_length=10 ** 6)
+    streamed = peak_memory(
+        f'for block in project.iter_segment_blocks({csv_file!r}, 2 ** 20): pass')
+    assert streamed < peak_memory(f'project.read_csv({csv_file!r})')
+
+
+@mark.parametrize(
+    'dna_str, k',
+    [
+        ('ATTACTC', 5),
+        ('ATGACTGAA', 3),
+        ('ACGT', 1),
+        ('ACG', 4),
+        # longest k-mer that fits in 64 bits
+        ('TTGCATGCAAGTCCAGTAGGACTGAACCTTGACAGCT', 32)
+    ])
+def test_encode_k_mers(dna_str: str, k: int) -> None:
+    k_mers, lefts, rights = _encode_k_mers(PackedSequence.from_string(dna_str).codes(), k)
+    expected_k_mers = _generate_k_mers(dna_str, k)
+    assert _decode_k_mers(k_mers, k) == expected_k_mers
+    assert _decode_k_mers(lefts, k - 1) == [k_mer[:-1] for k_mer in expected_k_mers]
+    assert _decode_k_mers(rights, k - 1) == [k_mer[1:] for k_mer in expected_k_mers]
 
 
 @mark.parametrize(
@@ -423,6 +729,261 @@ def test_is_valid_graph(DNA_edge_list: list, expected_validity: bool) -> None:
         debruijn_graph.add_edge(edge[0], edge[1])
 
     assert is_valid_graph(debruijn_graph) is expected_validity
+    assert is_valid_graph(_native_graph(DNA_edge_list)) is expected_validity
+
+
+@mark.parametrize('seed', range(5))
+def test_degree_summary(seed: int, monkeypatch) -> None:
+    # the same summary for every kind of graph, made again once an edge is added
+    if seed % 2:
+        json_data = random_genome_segments(200, 6, seed=seed)
+    else:
+        json_data = clean_data(random_dna_frame(30, error_rate=0.03, seed=seed))
+    graphs = [construct_graph(json_data, 6), construct_graph(json_data, 6, native=True)]
+    graphs += [compact_graph(graphs[1])]
+    nx_summary = project.degree_summary(graphs[0])
+    nodes = list(graphs[0].nodes())
+    unbalanced = [nodes[index] for index in nx_summary['unbalanced']]
+    assert unbalanced == [node for node in nodes
+                          if graphs[0].in_degree(node) != graphs[0].out_degree(node)]
+    assert project.degree_summary(graphs[1]) == nx_summary
+    assert project.degree_summary(graphs[2])['balanced'] is nx_summary['balanced']
+    for graph in graphs[1:]:
+        assert project.degree_summary(graph) is project.degree_summary(graph)
+    for graph in graphs:
+        if nx_summary['balanced'] and nx_summary['unbalanced']:
+            project._make_eulerian_graph(graph)
+            assert project.degree_summary(graph)['unbalanced'] == []
+
+    # the connectivity is not checked if the degrees already fail
+    monkeypatch.setattr(project, '_is_weakly_connected', None)
+    if not nx_summary['balanced']:
+        assert not any(is_valid_graph(graph) for graph in graphs)
+
+
+def test_is_valid_graph_edited() -> None:
+    # an edit that keeps the number of nodes and edges gives a new verdict
+    graph = nx.MultiDiGraph([('A', 'B'), ('B', 'C'), ('C', 'A')])
+    assert is_valid_graph(graph)
+    graph.remove_edge('B', 'C')
+    graph.add_edge('C', 'B')
+    assert not is_valid_graph(graph)
+    # plain directed graphs count their edges as well
+    assert not is_valid_graph(nx.DiGraph([('AT', 'TA'), ('AT', 'TC'), ('AT', 'TG')]))
+
+
+def test_is_valid_graph_long_path() -> None:
+    # a long path is checked without running into the recursion limit
+    debruijn_graph = random_genome_graph(5000, k=15)
+    assert is_valid_graph(debruijn_graph)
+    debruijn_graph.add_edge('A' * 14, 'C' * 14)
+    assert not is_valid_graph(debruijn_graph)
+
+
+def _native_graph(DNA_edge_list: list) -> DeBruijnGraph:
+    return DeBruijnGraph.from_edges(np.array([edge[0] for edge in DNA_edge_list], dtype=object),
+                                    np.array([edge[1] for edge in DNA_edge_list], dtype=object))
+
+
+@mark.parametrize(
+    'DNA_edge_list,  expected_sequence',
+    [
+        (
+            [('AAA', 'AAC'), ('AAC', 'ACA'), ('ACA', 'CAC')],
+            'AAACAC'
+        ),
+        # circuit: the first node is not repeated at the end
+        (
+            [('ATTA', 'TTAC'), ('TTAC', 'TACT'),
+             ('TACT', 'ACTC'), ('ACTC', 'ATTA')],
+            'ATTACTC'
+        ),
+        # node that is visited twice
+        (
+            [('ATT', 'TTA'), ('TTA', 'TAG'), ('TAG', 'AGT'),
+             ('AGT', 'GTA'), ('GTA', 'TTA')],
+            'ATTAGTAA'
+        )
+    ])
+def test_construct_dna_sequence(DNA_edge_list: list, expected_sequence: str) -> None:
+    debruijn_graph = nx.MultiDiGraph()
+    for edge in DNA_edge_list:
+        debruijn_graph.add_edge(edge[0], edge[1])
+
+    unitig_graph = compact_graph(debruijn_graph)
+    assert construct_dna_sequence(debruijn_graph) == expected_sequence
+    assert construct_dna_sequence(_native_graph(DNA_edge_list)) == expected_sequence
+    assert construct_dna_sequence(unitig_graph) == expected_sequence
+    assert construct_dna_sequence(compact_graph(_native_graph(DNA_edge_list))) == expected_sequence
+
+
+@mark.parametrize('seed', range(3))
+def test_construct_graph_dataframe(seed: int) -> None:
+    # the cleaned DataFrame gives the same graph as its JSON representation
+    clean_df = clean_data(random_dna_frame(100, error_rate=0.02, seed=seed))
+    for native in [False, True]:
+        graph = construct_graph(clean_df, 4, native=native)
+        json_graph = construct_graph(generate_sequences(clean_df), 4, native=native)
+        assert list(graph.nodes()) == list(json_graph.nodes())
+        assert sorted(graph.edges()) == sorted(json_graph.edges())
+
+
+@mark.parametrize('seed', range(5))
+def test_construct_dna_sequence_legacy(seed: int) -> None:
+    # same sequence as the original recursive algorithm on a dense matrix
+    expected_sequence = legacy_construct_dna_sequence(random_genome_graph(150, k=6, seed=seed))
+    assert construct_dna_sequence(random_genome_graph(150, k=6, seed=seed)) == expected_sequence
+    assert construct_dna_sequence(random_genome_graph(
+        150, k=6, native=True, seed=seed)) == expected_sequence
+
+
+def test_node_index() -> None:
+    # the node index follows edits of the graph, also if the number of nodes stays the same
+    debruijn_graph = construct_graph('[{"SegmentNr":1,"Sequence":"ATTACTC"}]', 4)
+    assert project._node_index(debruijn_graph) == {
+        'ATT': 0, 'TTA': 1, 'TAC': 2, 'ACT': 3, 'CTC': 4}
+    debruijn_graph.add_edge('CTC', 'TCA')
+    assert construct_dna_sequence(debruijn_graph) == 'ATTACTCA'
+    assert project._node_index(debruijn_graph)['TCA'] == 5
+
+    debruijn_graph = construct_graph('[{"SegmentNr":1,"Sequence":"ATTACTC"}]', 4)
+    debruijn_graph.remove_node('ATT')
+    debruijn_graph.add_edge('CTC', 'TCA')
+    assert is_valid_graph(debruijn_graph)
+    assert construct_dna_sequence(debruijn_graph) == 'TTACTCA'
+
+
+def test_construct_dna_sequence_long_path() -> None:
+    # no recursion limit or V x V matrix for long paths
+    assert len(construct_dna_sequence(random_genome_graph(20000, k=31))) == 20000 + 31 - 1
+
+
+@mark.parametrize('seed', range(3))
+def test_native_graph_assembly(seed: int) -> None:
+    # the array based graph gives the same graph and sequence as networkx
+    dna_df = random_dna_frame(30, error_rate=0.02, seed=seed)
+    packed_segments = clean_data(dna_df, packed=True)
+    for k in [3, 6]:
+        graph = construct_graph(packed_segments, k)
+        native_graph = construct_graph(packed_segments, k, native=True)
+        assert list(native_graph.nodes()) == list(graph.nodes())
+        assert sorted(native_graph.edges()) == sorted(graph.edges())
+        assert is_valid_graph(native_graph) is is_valid_graph(graph)
+        assert sorted(native_graph.to_networkx().edges()) == sorted(graph.edges())
+
+
+@mark.parametrize('seed', range(5))
+@mark.parametrize('k, n_k_mers', [(3, 50), (4, 300), (5, 2000), (21, 5000)])
+def test_compact_graph(seed: int, k: int, n_k_mers: int) -> None:
+    # the compacted graph is just as valid and spells the same sequence
+    segments = random_genome_segments(n_k_mers, k, seed)
+    graph = construct_graph(segments, k, native=True)
+    unitig_graph = compact_graph(graph)
+    assert unitig_graph.number_of_nodes() <= graph.number_of_nodes()
+    assert unitig_graph.label(0) == graph.label(0)
+    assert is_valid_graph(unitig_graph) is is_valid_graph(graph)
+    assert construct_dna_sequence(unitig_graph) == construct_dna_sequence(graph)
+    if k == 21:
+        # a single path: only the first and the last node are left
+        assert unitig_graph.number_of_nodes() == 2
+
+
+def test_compact_graph_cycle() -> None:
+    # a cycle apart from the first node keeps its nodes and stays not valid
+    graph = DeBruijnGraph.from_edges(np.array(['AB', 'BC', 'XY', 'YZ', 'ZX'], dtype=object),
+                                     np.array(['BC', 'CD', 'YZ', 'ZX', 'XY'], dtype=object))
+    unitig_graph = compact_graph(graph)
+    assert unitig_graph.nodes() == ['AB', 'CD', 'XY', 'YZ', 'ZX']
+    assert unitig_graph.spelling([0]) == 'CD'
+    assert not is_valid_graph(unitig_graph)
+    assert sorted(unitig_graph.to_networkx().edges(data='sequence')) == [
+        ('AB', 'CD', 'CD'), ('XY', 'YZ', 'Z'), ('YZ', 'ZX', 'X'), ('ZX', 'XY', 'Y')]
+
+
+@mark.parametrize('k', [3, 8, 35])
+def test_count_k_mers(k: int) -> None:
+    # counts in order of first appearance, the same as counting the k-mer strings
+    packed_segments = clean_data(random_dna_frame(40, error_rate=0.02, seed=k), packed=True)
+    k_mers = [k_mer for segment_nr in sorted(packed_segments)
+              for k_mer in _generate_k_mers(str(packed_segments[segment_nr]), k)
+              if 'N' not in k_mer]
+    expected_counts = pd.Series(k_mers, dtype=object).value_counts(sort=False)
+    table = project.count_k_mers(packed_segments, k)
+    assert table['KMer'].tolist() == expected_counts.index.tolist()
+    assert table['Count'].tolist() == expected_counts.tolist()
+    table = project.count_k_mers(packed_segments, k, min_abundance=2)
+    assert table['KMer'].tolist() == expected_counts[expected_counts >= 2].index.tolist()
+
+
+@mark.parametrize('k', [7, 33])
+def test_construct_graph_min_abundance(k: int) -> None:
+    # overlapping reads cover every k-mer twice, the k-mers of a read with an error once
+    genome = str(random_genome_segments(300, 40, seed=k)[0])
+    reads = {segment_nr: PackedSequence.from_string(genome[start:start + 60])
+             for segment_nr, start in enumerate(range(0, len(genome) - 59, 20))}
+    for segment_nr in list(reads):
+        reads[segment_nr + 100] = reads[segment_nr]
+    error_read = str(reads[3])
+    error_read = error_read[:30] + ('A' if error_read[30] != 'A' else 'C') + error_read[31:]
+    expected_graph = construct_graph(reads, k, native=True)
+    reads[200] = PackedSequence.from_string(error_read)
+    assert construct_graph(reads, k, native=True).number_of_nodes() > (
+        expected_graph.number_of_nodes())
+
+    for workers in [None, 2]:
+        graph = construct_graph(reads, k, native=True, workers=workers, min_abundance=2)
+        assert graph.labels == expected_graph.labels
+        assert np.array_equal(graph.sources, expected_graph.sources)
+        assert np.array_equal(graph.targets, expected_graph.targets)
+        nx_graph = construct_graph(reads, k, workers=workers, min_abundance=2)
+        assert list(nx_graph.nodes()) == graph.labels
+        assert sorted(nx_graph.edges()) == sorted(graph.edges())
+
+
+@mark.parametrize('workers', [2, 3])
+def test_construct_graph_workers(workers: int) -> None:
+    # counting the k-mers of groups of segments in parallel gives the same graph
+    packed_segments = clean_data(random_dna_frame(60, error_rate=0.02, seed=1), packed=True)
+    graph = construct_graph(packed_segments, 6, native=True)
+    sharded_graph = construct_graph(packed_segments, 6, native=True, workers=workers)
+    assert sharded_graph.labels == graph.labels
+    for name in ['sources', 'targets', 'multiplicity', 'offsets']:
+        assert np.array_equal(getattr(sharded_graph, name), getattr(graph, name))
+    nx_graph = construct_graph(packed_segments, 6, workers=workers)
+    assert list(nx_graph.nodes()) == graph.labels
+    assert construct_dna_sequence(nx_graph) == construct_dna_sequence(graph)
+
+
+@mark.parametrize('n_k_mers, k, native, max_nodes, complete', [
+    (100, 6, False, None, True), (100, 6, True, 500, True), (100, 6, False, 20, True),
+    (100, 6, True, 20, True), (2000, 4, False, 20, False), (2000, 4, True, 20, False)])
+def test_plot_graph(tmp_path, n_k_mers: int, k: int, native: bool, max_nodes,
+                    complete: bool) -> None:
+    # large graphs are plotted compacted and if that is still too large only in part,
+    # non planar graphs get a spring layout
+    graph = random_genome_graph(n_k_mers, k=k, native=native)
+    filename = str(tmp_path / 'graph.png')
+    assert project.plot_graph(graph, filename, max_nodes) is complete
+    assert os.path.getsize(filename) > 0
+
+
+def test_to_networkx_max_nodes() -> None:
+    graph = random_genome_graph(100, k=6, native=True)
+    part = graph.to_networkx(10)
+    assert list(part.nodes()) == graph.labels[:10]
+    assert sorted(part.edges()) == sorted(edge for edge in graph.edges()
+                                          if edge[0] in part and edge[1] in part)
+
+
+def test_import_is_light() -> None:
+    # the heavy dependencies are only loaded by the stages that use them
+    code = ('import sys, project; '
+            'graph = project.construct_graph({1: "ATTAGTAA"}, 3, native=True); '
+            'print(project.construct_dna_sequence(graph)); '
+            'print(sorted({"pandas", "networkx", "matplotlib"} & set(sys.modules)))')
+    process = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True,
+                             check=True, cwd=os.path.dirname(os.path.abspath(project.__file__)))
+    assert process.stdout.split('\n')[:2] == ['ATTAGTAA', "['pandas']"]
 
 
 # @mark.parametrize(
@@ -439,3 +1000,211 @@ def test_is_valid_graph(DNA_edge_list: list, expected_validity: bool) -> None:
 #         debruijn_graph.add_edge(edge[0], edge[1])
 
 #     assert construct_dna_sequence(debruijn_graph) in possible_dna_sequence
+
+
+def test_assemble_batch(tmp_path) -> None:
+    # parallel batch gives the same results as running the files one by one
+    for x in range(1, 5):
+        random_dna_frame(20, error_rate=0.01 * x, seed=x).to_csv(
+            tmp_path / f'DNA_{x}_{x + 2}.csv', header=False, index=False)
+    input_files = _expand_inputs([str(tmp_path)])
+    assert [os.path.basename(input_file) for input_file in input_files] == [
+        'DNA_1_3.csv', 'DNA_2_4.csv', 'DNA_3_5.csv', 'DNA_4_6.csv']
+
+    sequential_results = assemble_batch(input_files, workers=1, output_dir=str(tmp_path))
+    parallel_results = assemble_batch(input_files, workers=2, output_dir=str(tmp_path))
+    for sequential_result, parallel_result in zip(sequential_results, parallel_results):
+        assert sequential_result['k'] == parallel_result['k']
+        assert sequential_result['output'] == parallel_result['output']
+        x = parallel_result['x']
+        assert (tmp_path / f'DNA_{x}.txt').read_text() == parallel_result['output']
+
+
+def test_assemble_batch_errors(tmp_path) -> None:
+    # a missing file, a pattern without matches, a bad name or a malformed file is
+    # reported as failed and the other files are still assembled
+    random_dna_frame(20, seed=1).to_csv(tmp_path / 'DNA_1_3.csv', header=False, index=False)
+    (tmp_path / 'DNA_2_3.csv').write_text('1,1,1,0\n')
+    (tmp_path / 'sequences.csv').write_text('1,1,1,0,0,0\n')
+    input_files = _expand_inputs([str(tmp_path / name) for name in [
+        'DNA_1_3.csv', 'DNA_2_3.csv', 'DNA_9_*.csv', 'sequences.csv', 'DNA_3_3.csv']])
+    for workers in [1, 2]:
+        results = assemble_batch(input_files, workers=workers, output_dir=str(tmp_path))
+        assert [result['file'] for result in results] == input_files
+        assert 'error' not in results[0] and results[0]['valid'] is not None
+        assert all(set(result) == {'file', 'error', 'seconds'} for result in results[1:])
+    report_file = tmp_path / 'report.json'
+    project._write_report(str(report_file), results)
+    report = json.loads(report_file.read_text())
+    assert (report['files'], report['failed']) == (5, 4)
+    assert report['results'][1]['error'] == results[1]['error']
+
+
+@mark.parametrize('options, stages', [
+    ({}, ['read_csv', 'clean_positions', 'clean_segments', 'construct_graph']),
+    ({'save_json': True}, ['read_csv', 'clean_positions', 'clean_segments',
+                           'generate_sequences', 'construct_graph']),
+    ({'stream': True, 'block_size': 100}, ['construct_graph_streaming']),
+    ({'cache_dir': 'cache'}, ['cached_graph']),
+])
+def test_assemble_file_report(tmp_path, options: dict, stages: list) -> None:
+    # every stage is reported with its counters and runs inside the hooks
+    input_file = str(tmp_path / 'DNA_1_5.csv')
+    dna_df = random_dna_frame(40, error_rate=0.05, seed=3)
+    dna_df.to_csv(input_file, header=False, index=False)
+    if 'cache_dir' in options:
+        options = {**options, 'cache_dir': str(tmp_path / options['cache_dir'])}
+    entered = []
+
+    @contextlib.contextmanager
+    def hook(stage):
+        entered.append(stage)
+        yield
+
+    result = project.assemble_file(input_file, output_dir=str(tmp_path), track_memory=True,
+                                   hooks=[hook], **options)
+    graph_stage = stages[-1]
+    stages = stages + ['compact_graph', 'is_valid_graph']
+    stages += ['construct_dna_sequence', 'save_output'] if result['valid'] else ['save_output']
+    assert [stage['stage'] for stage in result['stages']] == stages == entered
+    assert all(stage['seconds'] >= 0 and stage['peak_memory'] >= 0
+               for stage in result['stages'])
+    counters = {stage['stage']: stage['counters'] for stage in result['stages']}
+    clean_df = clean_data(dna_df)
+    graph = construct_graph(clean_df, 5, native=True)
+    assert {key: counters[graph_stage][key] for key in ['nodes', 'edges', 'k_mers']} == {
+        'nodes': graph.number_of_nodes(), 'edges': len(graph.sources),
+        'k_mers': graph.number_of_edges()}
+    assert counters['is_valid_graph'] == {'valid': result['valid']}
+    # the streaming and cached stages count the cleaning like the separate stages
+    positions_df, to_remove_segment = _clean_positions(dna_df)
+    cleaning = {'rows': len(dna_df), 'positions_dropped': len(dna_df) - len(positions_df),
+                'segments_with_errors': len(to_remove_segment),
+                'segments_removed': (dna_df['SegmentNr'].nunique() -
+                                     clean_df['SegmentNr'].nunique()),
+                'segments_kept': clean_df['SegmentNr'].nunique()}
+    if options.keys() <= {'save_json'}:
+        cleaning_counters = {**counters['read_csv'], **counters['clean_positions'],
+                             **counters['clean_segments']}
+    else:
+        cleaning_counters = {key: value for key, value in counters[graph_stage].items()
+                             if key not in ['nodes', 'edges', 'k_mers', 'cache_hit']}
+    assert cleaning_counters == cleaning
+    if 'cache_dir' in options:
+        assert counters[graph_stage]['cache_hit'] is False
+        result = project.assemble_file(input_file, output_dir=str(tmp_path), **options)
+        assert result['stages'][0]['counters']['cache_hit'] is True
+    json.dumps(result['stages'])
+
+
+def test_stage_profiler(tmp_path) -> None:
+    # the profile of every stage is written, and the report has no peak memory by default
+    input_file = str(tmp_path / 'DNA_1_5.csv')
+    random_dna_frame(20, seed=1).to_csv(input_file, header=False, index=False)
+    result = project.assemble_file(input_file, output_dir=str(tmp_path),
+                                   hooks=[project.StageProfiler(str(tmp_path / 'profile'))])
+    assert sorted(os.listdir(tmp_path / 'profile')) == sorted(
+        f"{stage['stage']}.prof" for stage in result['stages'])
+    assert all(stage['peak_memory'] is None for stage in result['stages'])
+
+
+def test_segment_cache(tmp_path, monkeypatch) -> None:
+    # the second run reads the segments and k-mer counts from the cache
+    input_file = str(tmp_path / 'DNA_1_5.csv')
+    random_dna_frame(30, error_rate=0.02, seed=4).to_csv(input_file, header=False, index=False)
+    cache = project.SegmentCache(str(tmp_path / 'cache'))
+    packed_segments = clean_data(read_csv(input_file), packed=True)
+    graph = construct_graph(packed_segments, 5, native=True)
+
+    cached_graph = project._cached_graph(cache, input_file, 5)
+    assert cache.load_segments(cache.key(input_file)) == dict(sorted(packed_segments.items()))
+    monkeypatch.setattr(project, 'read_csv', None)
+    for k in [5, 5, 4]:
+        cached_graph = project._cached_graph(cache, input_file, k)
+        expected_graph = graph if k == 5 else construct_graph(packed_segments, k, native=True)
+        assert cached_graph.labels == expected_graph.labels
+        assert sorted(cached_graph.edges()) == sorted(expected_graph.edges())
+    cached_graph = project._cached_graph(cache, input_file, 5, min_abundance=2)
+    expected_graph = construct_graph(packed_segments, 5, native=True, min_abundance=2)
+    assert cached_graph.labels == expected_graph.labels
+    assert cached_graph.edges() == expected_graph.edges()
+    # filling the cache reads the whole file, streaming it would not save memory
+    with raises(ValueError):
+        project.assemble_file(input_file, stream=True, cache_dir=cache.directory)
+
+
+def test_segment_cache_eviction(tmp_path) -> None:
+    # a changed file gets a new entry and the least recently used entry is removed
+    cache = project.SegmentCache(str(tmp_path / 'cache'), max_bytes=1)
+    input_file = tmp_path / 'DNA_1_5.csv'
+    keys = []
+    for seed in range(3):
+        random_dna_frame(10, seed=seed).to_csv(input_file, header=False, index=False)
+        keys += [cache.key(str(input_file))]
+        cache.store_segments(keys[-1], clean_data(read_csv(str(input_file)), packed=True))
+    assert len(set(keys)) == 3
+    assert os.listdir(cache.directory) == [keys[-1]]
+    assert cache.load_segments(keys[0]) is None
+
+
+@mark.parametrize('seed', range(3))
+def test_sweep_k(seed: int) -> None:
+    # every k gives the same graph and sequence as building it on its own
+    packed_segments = clean_data(random_dna_frame(50, error_rate=0.02, seed=seed), packed=True)
+    packed_segments.update({100 + segment_nr: sequence for segment_nr, sequence in
+                            random_genome_segments(300, 5, seed).items()})
+    results = project.sweep_k(packed_segments, [34, 2, 5, 3, 8, 33])
+    assert [result['k'] for result in results] == [2, 3, 5, 8, 33, 34]
+    for result in results:
+        graph = construct_graph(packed_segments, result['k'], native=True)
+        assert result['nodes'] == graph.number_of_nodes()
+        assert result['edges'] == graph.number_of_edges()
+        assert result['valid'] is is_valid_graph(graph)
+        assert result['output'] == (construct_dna_sequence(graph) if result['valid'] else '')
+
+
+def test_best_k(tmp_path) -> None:
+    # the k with the longest sequence from a valid, non empty graph is chosen (the
+    # largest k only on a tie) and written
+    genome = 'ATTAGTAACCGTTAGTAAGG'
+    input_file = tmp_path / 'DNA_7_3.csv'
+    pd.DataFrame([[1, position + 1] + [int(letter == nucleotide) for nucleotide in 'ACGT']
+                  for position, letter in enumerate(genome)]).to_csv(
+        input_file, header=False, index=False)
+    results = project.assemble_k_sweep(str(input_file), range(2, 25), str(tmp_path))
+    assert project.best_k(results)['k'] == 20
+    assert (tmp_path / 'DNA_7.txt').read_text() == genome
+    assert project.best_k([result for result in results if result['k'] > 20]) is None
+
+
+def test_best_k_short_segments() -> None:
+    # a k longer than the short segments only sees the one long segment
+    genome = str(random_genome_segments(56, 5, seed=2)[0])
+    # 12 bp segments and one 20 bp segment at the end, each overlapping by 4
+    segments = {segment_nr: PackedSequence.from_string(genome[start:start + 12])
+                for segment_nr, start in enumerate(range(0, 40, 8))}
+    segments[5] = PackedSequence.from_string(genome[40:])
+    results = project.sweep_k(segments, range(2, 21))
+    assert [result['length'] for result in results if result['k'] > 12] == [20] * 8
+    best = project.best_k(results)
+    assert best['k'] == 5 and best['output'] == genome
+
+
+@mark.parametrize('seed', range(5))
+def test_sequencing_frame(seed: int) -> None:
+    # all injected errors are cleaned and the genome is reconstructed
+    dna_df, genome = sequencing_frame(3000, k=25, segment_length=60, error_rate=0.2, seed=seed)
+    repeated_df, _ = sequencing_frame(3000, k=25, segment_length=60, error_rate=0.2, seed=seed)
+    assert dna_df.equals(repeated_df)
+    dna_clean_df = clean_data(dna_df)
+    assert len(dna_clean_df) < len(dna_df) - len(genome)
+    assert dna_clean_df['SegmentNr'].max() == dna_clean_df['SegmentNr'].nunique()
+    graph = compact_graph(construct_graph(dna_clean_df, 25, native=True))
+    assert is_valid_graph(graph)
+    assert construct_dna_sequence(graph) == genome
+
+
+def test_benchmark_pipeline() -> None:
+    results = benchmark_pipeline([2000, 5000])
+    assert [result['genome'] for result in results] == [2000, 5000]
+    assert all(result['correct'] for result in results)